@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+
+"""
+Backends receiving the lines drawn by the fractals.
+
+The generators of main.py only compute geometry and give it to a backend by polylines or by batches of segments. A
+backend rasterizes them with pillow (PilBackend) or with NumPy (RasterBackend), writes them to a vector file
+(vector.SvgImage, vector.PdfImage), only counts them (NullBackend) or only measures them (BoundsBackend), so the fastest
+one can be picked for each job and geometry can be measured without rasterization.
+
+>>> backend = RasterBackend((8, 8), 'L')
+>>> backend.line([(0, 0), (5, 3)], fill=255)
+>>> backend.pixels[:4, :6]
+array([[255,   0,   0,   0,   0,   0],
+       [  0, 255, 255,   0,   0,   0],
+       [  0,   0,   0, 255, 255,   0],
+       [  0,   0,   0,   0,   0, 255]], dtype=uint8)
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+class Backend:
+    """Destination of the lines drawn by a Canvas
+
+    Subclasses implement segments, and polyline when they can draw a polyline faster than its segments.
+
+    :param size: Size of the image, in pixels
+    :param mode: Mode of the image, used to read the colors
+    :type size: tuple
+    :type mode: str"""
+    stage = "rasterization"
+
+    def __init__(self, size, mode='RGB'):
+        self.size = tuple(size)
+        self.mode = mode
+
+    def line(self, xy, fill=None, width=None, joint=None):
+        """Draw a polyline
+
+        Parameters are the same than ImageDraw.line"""
+        points = np.asarray(xy, dtype=float).reshape(-1, 2)
+        if len(points) > 1:
+            self.polyline(points, fill, width)
+
+    def polyline(self, points, fill=None, width=None):
+        """Draw a polyline
+
+        :param points: Points of the polyline, in pixels
+        :param fill: Color of the line
+        :param width: Width of the line, in pixels, None for the default of ImageDraw.line
+        :type points: numpy.ndarray
+        :type fill: tuple
+        :type width: int"""
+        self.segments(np.column_stack((points[:-1], points[1:])), fill, width)
+
+    def segments(self, segments, fill=None, width=None):
+        """Draw a batch of segments
+
+        :param segments: Array of segments (x0, y0, x1, y1), in pixels
+        :param fill: Color of the segments
+        :param width: Width of the segments, in pixels, None for the default of ImageDraw.line
+        :type segments: numpy.ndarray
+        :type fill: tuple
+        :type width: int"""
+        raise NotImplementedError
+
+    def point(self, xy, fill=None):
+        """Draw points
+
+        Parameters are the same than ImageDraw.point"""
+        raise NotImplementedError
+
+    def save(self, fp=None, format=None, **params):
+        """Write the drawing
+
+        Parameters are the same than Image.save"""
+
+    def to_image(self):
+        """Pillow image of the drawing so far
+
+        :rtype: Image.Image"""
+        raise NotImplementedError("{} has no image".format(type(self).__name__))
+
+    def snapshot(self):
+        """Copy of the drawing so far, to be restored later
+
+        :return: Opaque copy of the drawing"""
+        raise NotImplementedError("{} can not be restored".format(type(self).__name__))
+
+    def restore(self, snapshot):
+        """Replace the drawing by a snapshot
+
+        :param snapshot: Value returned by snapshot"""
+        raise NotImplementedError("{} can not be restored".format(type(self).__name__))
+
+    @staticmethod
+    def _runs(segments):
+        """Split segments into polylines of consecutive segments
+
+        >>> [run.tolist() for run in Backend._runs(np.array([[0, 0, 1, 1], [1, 1, 2, 0], [5, 5, 6, 6]]))]
+        [[[0, 0], [1, 1], [2, 0]], [[5, 5], [6, 6]]]
+
+        :param segments: Array of segments (x0, y0, x1, y1)
+        :type segments: numpy.ndarray
+
+        :return: Generator of arrays of points
+        :rtype: generator"""
+        breaks = np.flatnonzero((segments[1:, :2] != segments[:-1, 2:]).any(axis=1)) + 1
+        for run in np.split(segments, breaks):
+            yield np.concatenate((run[:, :2], run[-1:, 2:]))
+
+
+class PilBackend(Backend):
+    """Backend drawing on a pillow image with ImageDraw
+
+    :param image: Image to draw on
+    :param mode: Mode of ImageDraw, the mode of the image if None
+    :type image: Image.Image
+    :type mode: str"""
+
+    def __init__(self, image, mode=None):
+        super().__init__(image.size, image.mode)
+        self.image = image
+        self.draw = ImageDraw.Draw(image, mode)
+
+    def line(self, xy, fill=None, width=None, joint=None):
+        if width is None:
+            self.draw.line(xy, fill, joint=joint)
+        else:
+            self.draw.line(xy, fill, width, joint)
+
+    def polyline(self, points, fill=None, width=None):
+        self.line(points.ravel().tolist(), fill, width)
+
+    def segments(self, segments, fill=None, width=None):
+        for points in self._runs(segments):
+            self.polyline(points, fill, width)
+
+    def point(self, xy, fill=None):
+        self.draw.point(xy, fill)
+
+    def save(self, fp=None, format=None, **params):
+        self.image.save(fp, format, **params)
+
+    def to_image(self):
+        return self.image
+
+    def snapshot(self):
+        return self.image.copy()
+
+    def restore(self, snapshot):
+        self.image.paste(snapshot)
+
+
+class RasterBackend(Backend):
+    """Backend drawing in a NumPy array of pixels
+
+    Thin lines are buffered and rasterized by batches of at least batch_size segments, with the same pixels than
+    pillow for a width of 1. A width of 0 draws the same thin lines, like older versions of pillow did (recent ones
+    draw nothing). Wide lines are drawn by pillow on the part of the array they cover and can differ on a few pixels
+    from a line drawn on the whole image.
+
+    Pixels of the modes RGB, RGBA, L, I and F are held as one value by pixel (RGB as RGBX), so to_image can share the
+    array with pillow without copying it.
+
+    :param size: Size of the image, in pixels
+    :param mode: Mode of the image
+    :param background: Color of the background
+    :param batch_size: Number of thin segments buffered before they are rasterized
+    :type size: tuple
+    :type mode: str
+    :type background: tuple
+    :type batch_size: int"""
+    STORAGE = {"RGB": ("RGBX", np.uint32), "RGBA": ("RGBA", np.uint32), "L": ("L", np.uint8), "I": ("I", np.int32),
+               "F": ("F", np.float32)}
+    max_pixels = 1 << 22
+
+    def __init__(self, size, mode='RGB', background=0, batch_size=1 << 16):
+        super().__init__(size, mode)
+        self._storage, self._dtype = self.STORAGE.get(mode, (None, None))
+        self.batch_size = batch_size
+        self._inks = {}
+        self._batch = []
+        self._batched = 0
+        self._fill = None
+        self._pixels = self._array(Image.new(mode, self.size, background))
+
+    @property
+    def pixels(self):
+        """Array of the pixels, indexed by row then column
+
+        :rtype: numpy.ndarray"""
+        self.flush()
+        return self._pixels
+
+    def _array(self, image):
+        """Pixels of a pillow image, one value by pixel when the mode allows it"""
+        if self._storage is None:
+            return np.array(image)
+        width, height = image.size
+        return np.array(image.convert(self._storage)).view(self._dtype).reshape(height, width)
+
+    def _image(self, pixels):
+        """Pillow image of pixels, sharing their memory when the mode allows it"""
+        if self._storage is None:
+            return Image.fromarray(pixels) if pixels.dtype == bool else Image.fromarray(pixels, self.mode)
+        height, width = pixels.shape
+        return Image.frombuffer(self._storage, (width, height), pixels, "raw", self._storage, 0, 1)
+
+    def _ink(self, fill):
+        """Value of the pixels of a color, white if None"""
+        key = "white" if fill is None else fill
+        if isinstance(key, list):
+            key = tuple(key)
+        ink = self._inks.get(key)
+        if ink is None:
+            ink = self._inks[key] = self._array(Image.new(self.mode, (1, 1), key))[0, 0]
+        return ink
+
+    @staticmethod
+    def _steps(start, sign, extent):
+        """Range of steps k such that start + sign * k is in [0, extent - 1], empty when low > high"""
+        low = np.where(sign > 0, -start, np.where(sign < 0, start - extent + 1, 0))
+        high = np.where(sign > 0, extent - 1 - start, np.where(sign < 0, start, np.iinfo(np.int64).max // 4))
+        empty = (sign == 0) & ((start < 0) | (start >= extent))
+        return np.where(empty, 1, low), np.where(empty, 0, high)
+
+    @classmethod
+    def rasterize(cls, segments, size):
+        """Pixels of thin segments inside an image, like Bresenham's algorithm of pillow
+
+        Coordinates are truncated like pillow does. The i-th pixel of a segment is i steps along its major axis and
+        i * minor / major steps, rounded half up, along its minor axis, so the steps whose pixel is inside the image
+        are computed in closed form and only visible pixels are generated, for all segments at once.
+
+        >>> [indexes.tolist() for indexes in RasterBackend.rasterize(
+        ...     np.array([[0, 0, 2, 1], [3, 3, 3, 3], [-5, 0, -1, 0], [-2, 4, 1, 4]]), (8, 8))]
+        [[0, 9, 10, 27, 32, 33]]
+
+        :param segments: Array of segments (x0, y0, x1, y1), in pixels
+        :param size: Size of the image, in pixels
+        :type segments: numpy.ndarray
+        :type size: tuple
+
+        :return: Generator of indexes (row * width + column) of at most about max_pixels pixels, a pixel can be
+            repeated
+        :rtype: generator"""
+        segments = np.trunc(segments).astype(np.int64)
+        x0, y0 = segments[:, 0], segments[:, 1]
+        dx, dy = segments[:, 2] - x0, segments[:, 3] - y0
+        horizontal = np.abs(dx) >= np.abs(dy)
+        major = np.maximum(np.abs(dx), np.abs(dy))
+        minor = np.minimum(np.abs(dx), np.abs(dy))
+        sx, sy = np.sign(dx), np.sign(dy)
+        x_low, x_high = cls._steps(x0, sx, size[0])
+        y_low, y_high = cls._steps(y0, sy, size[1])
+        low = np.where(horizontal, x_low, y_low)
+        high = np.where(horizontal, x_high, y_high)
+        offset_low = np.where(horizontal, y_low, x_low)
+        offset_high = np.where(horizontal, y_high, x_high)
+        # offset(i) >= a  <=>  i >= ceil((2a - 1) major / 2 minor)
+        # offset(i) <= b  <=>  i < ceil((2b + 1) major / 2 minor)
+        sloped = minor > 0
+        divisor = np.maximum(2 * minor, 1)
+        offset_low = np.clip(offset_low, -1, major + 1)
+        offset_high = np.clip(offset_high, -1, major + 1)
+        low = np.maximum(low, np.where(sloped, -((-(2 * offset_low - 1) * major) // divisor), 0))
+        high = np.minimum(high, np.where(sloped, -((-(2 * offset_high + 1) * major) // divisor) - 1, high))
+        empty = ~sloped & ((offset_low > 0) | (offset_high < 0))
+        low, high = np.maximum(low, 0), np.minimum(high, major)
+        counts = np.where(empty, 0, np.maximum(high - low + 1, 0))
+        visible = np.flatnonzero(counts)
+        counts, low = counts[visible], low[visible]
+        major, minor, horizontal = major[visible], minor[visible], horizontal[visible]
+        sx, sy = sx[visible], sy[visible]
+        # index = origin + major_stride * step + minor_stride * offset(step)
+        origins = y0[visible] * size[0] + x0[visible]
+        major_strides = np.where(horizontal, sx, sy * size[0])
+        minor_strides = np.where(horizontal, sy * size[0], sx)
+        ends = np.cumsum(counts)
+        first = 0
+        while first < len(counts):
+            last = max(int(np.searchsorted(ends, ends[first] - counts[first] + cls.max_pixels, "right")), first + 1)
+            chunk = slice(first, last)
+            repeat = counts[chunk]
+            starts = ends[chunk] - repeat - (ends[first] - counts[first])
+            steps = np.arange(int(repeat.sum())) - np.repeat(starts - low[chunk], repeat)
+            if ((minor[chunk] == 0) | (minor[chunk] == major[chunk])).all():
+                # straight and diagonal segments: offset(step) is 0 or step
+                strides = major_strides[chunk] + np.where(minor[chunk] == 0, 0, minor_strides[chunk])
+                yield np.repeat(origins[chunk], repeat) + np.repeat(strides, repeat) * steps
+            else:
+                offsets = (np.repeat(2 * minor[chunk], repeat) * steps + np.repeat(major[chunk], repeat)) // (
+                    np.repeat(np.maximum(2 * major[chunk], 1), repeat))
+                yield (np.repeat(origins[chunk], repeat) + np.repeat(major_strides[chunk], repeat) * steps +
+                       np.repeat(minor_strides[chunk], repeat) * offsets)
+            first = last
+
+    def polyline(self, points, fill=None, width=None):
+        if width and width > 1:
+            self.flush()
+            self._wide(points, fill, width)
+        else:
+            self.segments(np.column_stack((points[:-1], points[1:])), fill, width)
+
+    def segments(self, segments, fill=None, width=None):
+        if width and width > 1:
+            self.flush()
+            for points in self._runs(segments):
+                self._wide(points, fill, width)
+            return
+        if self._batch and fill != self._fill:
+            self.flush()
+        self._fill = fill
+        self._batch.append(segments)
+        self._batched += len(segments)
+        if self._batched >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Rasterize the buffered segments"""
+        if not self._batch:
+            return
+        segments = np.concatenate(self._batch)
+        self._batch = []
+        self._batched = 0
+        ink = self._ink(self._fill)
+        pixels = self._pixels.reshape((-1,) + self._pixels.shape[2:])
+        for indexes in self.rasterize(segments, self.size):
+            pixels[indexes] = ink
+
+    def _wide(self, points, fill, width):
+        """Draw a wide polyline with pillow on the part of the array it covers"""
+        margin = width + 1
+        left, top = np.maximum(np.floor(points.min(axis=0)).astype(int) - margin, 0)
+        right, bottom = np.minimum(np.ceil(points.max(axis=0)).astype(int) + margin, self.size)
+        if left >= right or top >= bottom:
+            return
+        region = self._image(np.ascontiguousarray(self._pixels[top:bottom, left:right])).convert(self.mode)
+        ImageDraw.Draw(region).line((points - (left, top)).ravel().tolist(), fill, width)
+        self._pixels[top:bottom, left:right] = self._array(region)
+
+    def point(self, xy, fill=None):
+        self.flush()
+        points = np.trunc(np.asarray(xy, dtype=float).reshape(-1, 2)).astype(np.int64)
+        width, height = self.size
+        inside = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+        self._pixels[points[inside, 1], points[inside, 0]] = self._ink(fill)
+
+    def to_image(self):
+        """Pillow image of the pixels
+
+        The image shares the memory of the array when the mode allows it, its mode is then RGBX for RGB.
+
+        :return: The image
+        :rtype: Image.Image"""
+        return self._image(self.pixels)
+
+    def save(self, fp=None, format=None, **params):
+        image = self.to_image()
+        if image.mode != self.mode:
+            image = image.convert(self.mode)
+        image.save(fp, format, **params)
+
+    def snapshot(self):
+        return self.pixels.copy()
+
+    def restore(self, snapshot):
+        self.flush()
+        self._pixels[...] = snapshot
+
+
+class NullBackend(Backend):
+    """Backend which only counts what is drawn, to measure geometry without rasterization
+
+    >>> backend = NullBackend((10, 10))
+    >>> backend.line([0, 0, 1, 1, 2, 0])
+    >>> backend.polylines, backend.segment_count
+    (1, 2)"""
+
+    def __init__(self, size=(0, 0), mode='RGB'):
+        super().__init__(size, mode)
+        self.polylines = 0
+        self.segment_count = 0
+        self.points = 0
+
+    def polyline(self, points, fill=None, width=None):
+        self.polylines += 1
+        self.segment_count += len(points) - 1
+
+    def segments(self, segments, fill=None, width=None):
+        self.segment_count += len(segments)
+
+    def point(self, xy, fill=None):
+        self.points += np.size(xy) // 2
+
+
+class TransformBackend(Backend):
+    """Backend scaling and shifting the lines before giving them to another backend
+
+    The segments which end up wholly outside the image of the other backend are dropped, so a tile of a large drawing
+    only rasterizes its own lines. The width of the lines is not scaled. Pillow truncates coordinates toward zero,
+    snap rounds them down to whole pixels first, so a tile whose offset is whole draws the same pixels than the same
+    region of a single large image, even where its lines come from negative coordinates.
+
+    >>> backend = NullBackend((10, 10))
+    >>> TransformBackend(backend, 0.5, (-14, 0)).line([0, 0, 20, 0, 40, 0])
+    >>> backend.polylines, backend.segment_count
+    (1, 1)
+
+    :param backend: Backend drawing the transformed lines
+    :param scale: Factor applied to the coordinates
+    :param offset: Shift applied after the scale, in pixels of backend
+    :param snap: Round the coordinates down to whole pixels
+    :type backend: Backend
+    :type scale: float
+    :type offset: tuple
+    :type snap: bool"""
+
+    def __init__(self, backend, scale=1, offset=(0, 0), snap=False):
+        super().__init__((0, 0), backend.mode)
+        self.backend = backend
+        self.scale = scale
+        self.offset = np.asarray(offset, dtype=float)
+        self.snap = snap
+        self.stage = backend.stage
+
+    def _transform(self, points):
+        points = points * self.scale + self.offset
+        return np.floor(points) if self.snap else points
+
+    def polyline(self, points, fill=None, width=None):
+        points = self._transform(points)
+        segments = np.column_stack((points[:-1], points[1:]))
+        shown = visible(segments, self.backend.size, (width or 1) + 1)
+        if shown.all():
+            self.backend.polyline(points, fill, width)
+        elif shown.any():
+            for run in self._runs(segments[shown]):
+                self.backend.polyline(run, fill, width)
+
+    def segments(self, segments, fill=None, width=None):
+        segments = np.column_stack((self._transform(segments[:, :2]), self._transform(segments[:, 2:])))
+        segments = segments[visible(segments, self.backend.size, (width or 1) + 1)]
+        if len(segments):
+            self.backend.segments(segments, fill, width)
+
+    def point(self, xy, fill=None):
+        self.backend.point(self._transform(np.asarray(xy, dtype=float).reshape(-1, 2)).ravel().tolist(), fill)
+
+    def save(self, fp=None, format=None, **params):
+        self.backend.save(fp, format, **params)
+
+    def to_image(self):
+        return self.backend.to_image()
+
+    def snapshot(self):
+        return self.backend.snapshot()
+
+    def restore(self, snapshot):
+        self.backend.restore(snapshot)
+
+
+class BoundsBackend(Backend):
+    """Backend which only keeps the bounding box of what is drawn, to fit an image to a drawing
+
+    Lines wider than a pixel grow the box by half their width.
+
+    >>> backend = BoundsBackend()
+    >>> backend.line([0, 5, 3, -2, 7, 1])
+    >>> backend.line([10, 0, 12, 0], width=4)
+    >>> backend.bounds
+    (0.0, -2.0, 14.0, 5.0)"""
+    stage = "geometry"
+
+    def __init__(self, size=(0, 0), mode='RGB'):
+        super().__init__(size, mode)
+        self.bounds = None
+
+    def _extend(self, points, width):
+        """Grow the bounding box to points
+
+        :param points: Array of points (x, y), in pixels
+        :param width: Width of the lines, in pixels
+        :type points: numpy.ndarray
+        :type width: int"""
+        if not len(points):
+            return
+        grow = width / 2 if width and width > 1 else 0
+        low, high = points.min(axis=0) - grow, points.max(axis=0) + grow
+        if self.bounds is not None:
+            low = np.minimum(low, self.bounds[:2])
+            high = np.maximum(high, self.bounds[2:])
+        self.bounds = tuple(low.tolist() + high.tolist())
+
+    def polyline(self, points, fill=None, width=None):
+        self._extend(points, width)
+
+    def segments(self, segments, fill=None, width=None):
+        self._extend(segments.reshape(-1, 2), width)
+
+    def point(self, xy, fill=None):
+        self._extend(np.asarray(xy, dtype=float).reshape(-1, 2), 0)
+
+
+def visible(segments, size, margin=2):
+    """Mask of the segments whose bounding box meets the image grown by margin pixels
+
+    Segments out of the mask can not touch a pixel of the image and can be skipped before rasterization.
+
+    >>> visible(np.array([[0, 0, 5, 5], [-9, 2, -4, 8], [3, 12, 20, 30], [-5, -5, 20, 20]]), (10, 10))
+    array([ True, False, False,  True])
+
+    :param segments: Array of segments (x0, y0, x1, y1), in pixels
+    :param size: Size of the image
+    :param margin: Margin around the image, at least half the width of the lines
+    :type segments: numpy.ndarray
+    :type size: tuple
+    :type margin: float
+
+    :return: Boolean array, True for the segments which may be visible
+    :rtype: numpy.ndarray"""
+    width, height = size
+    x0, y0, x1, y1 = segments.T
+    return ((np.maximum(x0, x1) >= -margin) & (np.minimum(x0, x1) < width + margin) &
+            (np.maximum(y0, y1) >= -margin) & (np.minimum(y0, y1) < height + margin))
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""
+Render many fractals in parallel from a manifest.
+
+A manifest is a JSON list of specs, or a JSON lines file with a spec by line. A spec gives the generator (see
+cache.draw), its arguments, the image and the output file, the format is guessed from the extension and .svg or .pdf
+outputs are streamed as vector images:
+
+    {"generator": "Lsystem.dragon", "args": [2, 16], "kwargs": {"color": [255, 255, 255], "width": 1},
+     "size": [2000, 2000], "position": [1000, 1000], "output": "renders/dragon.png"}
+
+Jobs are run by a pool of processes which stay alive between jobs, with at most two jobs by worker waiting, so a
+large manifest is never loaded at once. Each job is reported with its time, a failed job does not stop the others.
+
+    python batch.py manifest.jsonl --workers 4 --report report.jsonl --cache ~/.cache/fractal
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import chain
+
+from PIL import Image
+
+from cache import RenderCache, background_of, draw
+from vector import open_vector
+
+VECTOR_FORMATS = ("SVG", "PDF")
+
+
+def read_manifest(path):
+    """Read the specs of a manifest, JSON list or JSON lines
+
+    :param path: Path of the manifest
+    :type path: str
+
+    :return: Generator of specs
+    :rtype: generator"""
+    with open(path) as manifest:
+        first = manifest.read(1)
+        while first.isspace():
+            first = manifest.read(1)
+        if first == "[":
+            yield from json.loads(first + manifest.read())
+            return
+        for line in chain([first + manifest.readline()], manifest):
+            if line.strip():
+                yield json.loads(line)
+
+
+def _tuples(value):
+    """Turn the lists of JSON into tuples, as expected by pillow for colors and positions
+
+    >>> _tuples([[255, 0, 0], {"color": [1, 2, 3]}])
+    ((255, 0, 0), {'color': (1, 2, 3)})"""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _tuples(item) for key, item in value.items()}
+    return value
+
+
+def _format(spec):
+    """Format of the output of a spec, from its format key or the extension of its output"""
+    if spec.get("format"):
+        return spec["format"].upper()
+    extension = os.path.splitext(spec["output"])[1].lower()
+    if extension[1:].upper() in VECTOR_FORMATS:
+        return extension[1:].upper()
+    return Image.registered_extensions()[extension]
+
+
+def render(spec, cache_directory=None):
+    """Render a spec to its output file
+
+    :param spec: Spec of the render
+    :param cache_directory: Directory of a RenderCache used for raster outputs, None to always draw
+    :type spec: dict
+    :type cache_directory: str"""
+    spec = _tuples(spec)
+    output, format = spec["output"], _format(spec)
+    parameters = {"args": spec.get("args", ()), "kwargs": spec.get("kwargs"), "size": spec.get("size", (1000, 1000)),
+                  "mode": spec.get("mode", "RGB"),
+                  "background": background_of(spec["generator"], spec.get("background")),
+                  "position": spec.get("position")}
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if format in VECTOR_FORMATS:
+        with open_vector(output, parameters["size"], format, parameters["mode"], parameters["background"]) as image:
+            draw(spec["generator"], image=image, **parameters)
+    elif cache_directory is not None:
+        data = RenderCache(cache_directory).render(spec["generator"], format=format, **parameters)
+        with open(output, "wb") as file:
+            file.write(data)
+    else:
+        draw(spec["generator"], **parameters).save(output, format)
+
+
+def run_job(index, spec, cache_directory=None):
+    """Render a spec and report it, errors are reported instead of raised
+
+    :param index: Index of the spec in the manifest
+    :param spec: Spec of the render
+    :param cache_directory: Directory of a RenderCache, None to always draw
+    :type index: int
+    :type spec: dict
+    :type cache_directory: str
+
+    :return: Report with the index, the output, the status ("ok" or "failed"), the wall time and the error
+    :rtype: dict"""
+    start = time.perf_counter()
+    report = {"index": index, "output": spec.get("output") if isinstance(spec, dict) else None, "status": "ok"}
+    try:
+        render(spec, cache_directory)
+    except Exception:
+        report.update(status="failed", error=traceback.format_exc(limit=-3))
+    report["wall_time"] = time.perf_counter() - start
+    return report
+
+
+def run(specs, workers=None, cache_directory=None):
+    """Render specs in a pool of processes
+
+    :param specs: Specs to render
+    :param workers: Number of processes, defaults to the number of CPUs, 1 to render in the current process
+    :param cache_directory: Directory of a RenderCache, None to always draw
+    :type specs: iterable
+    :type workers: int
+    :type cache_directory: str
+
+    :return: Generator of the reports of the jobs, in order of completion
+    :rtype: generator"""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for index, spec in enumerate(specs):
+            yield run_job(index, spec, cache_directory)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for index, spec in enumerate(specs):
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(run_job, index, spec, cache_directory))
+        for future in wait(pending).done:
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the fractals of a manifest in parallel")
+    parser.add_argument("manifest", help="JSON list or JSON lines file of render specs")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes, defaults to the CPUs")
+    parser.add_argument("--report", default=None, help="JSON lines file where the report of each job is written")
+    parser.add_argument("--cache", default=None, help="Directory of a render cache shared by the jobs")
+    arguments = parser.parse_args(argv)
+    failures = 0
+    start = time.perf_counter()
+    report = open(arguments.report, "w") if arguments.report else None
+    try:
+        for result in run(read_manifest(arguments.manifest), arguments.workers, arguments.cache):
+            if report is not None:
+                report.write(json.dumps(result) + "\n")
+                report.flush()
+            print("{status:6} {wall_time:8.3f}s #{index} {output}".format(**result))
+            if result["status"] != "ok":
+                failures += 1
+                print(result["error"], file=sys.stderr)
+    finally:
+        if report is not None:
+            report.close()
+    print("{} failed, {:.3f}s".format(failures, time.perf_counter() - start))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of every fractal generator at increasing depths and image sizes.
+
+Each measurement runs in a fresh process, so the peak resident memory is the one of that measurement only. Results
+are appended as JSON lines to the output file, one line per measurement.
+
+    python benchmark.py --output benchmark.jsonl --label v1.2
+    python benchmark.py --generators lsystem.dragon turtle.koch_curve --sizes 1000 --repeat 3
+    python benchmark.py --backend null --label geometry
+"""
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from PIL import Image
+
+import betterTurtle
+from backends import NullBackend, RasterBackend
+from main import Figures, Lsystem
+from profiling import Stats
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BACKENDS = {
+    "pil": lambda size: Image.new('RGB', (size, size)),
+    "raster": lambda size: RasterBackend((size, size)),
+    "null": lambda size: NullBackend((size, size)),
+}
+
+
+def _lsystem(preset, length):
+    """Build a benchmark of a preset of Lsystem
+
+    :param preset: Name of the preset method
+    :param length: Length of a segment, in pixels
+    :type preset: str
+    :type length: float
+
+    :return: Function drawing the preset for a depth, an image size, stats and a backend
+    :rtype: function"""
+    def run(depth, size, stats, backend):
+        lsystem = Lsystem(BACKENDS[backend](size), stats=stats)
+        lsystem.set_pos(size / 2, size / 2)
+        getattr(lsystem, preset)(length, depth, color=(255, 255, 255), width=1)
+    return run
+
+
+def _flake(depth, size, stats, backend):
+    figures = Figures(BACKENDS[backend](size), stats=stats)
+    figures.von_koch_curve_flake((size / 2, size / 2), size * 0.4, depth, color=(255, 255, 255), width=1)
+
+
+def _blanc_manger(depth, size, stats, backend):
+    figures = Figures(BACKENDS[backend](size), stats=stats)
+    figures.blanc_manger((size * 0.1, size * 0.6), (size * 0.9, size * 0.6), depth, color=(255, 255, 255), width=1)
+
+
+def _turtle(draw):
+    """Build a benchmark of a drawing of betterTurtle
+
+    :param draw: Function drawing with a turtle for a depth and an image size
+    :type draw: function
+
+    :return: Function drawing for a depth, an image size, stats and a backend
+    :rtype: function"""
+    def run(depth, size, stats, backend):
+        output = None if backend == "pil" else BACKENDS[backend](size)
+        turtle = betterTurtle.Turtle(size=(size, size), resolution=1, recording=True, stats=stats, output=output)
+        draw(turtle, depth, size)
+        turtle.flush()
+    return run
+
+
+def _outline(turtle, depth, size):
+    turtle.set_position((size * 0.3, size * 0.3))
+    turtle.fractal.outline(depth, size * 0.4 / 3 ** depth, 4)
+
+
+def _turtle_dragon(turtle, depth, size):
+    turtle.fractal.dragon(2, depth)
+
+
+def _koch_curve(turtle, depth, size):
+    turtle.set_position((size * 0.1, size * 0.6))
+    turtle.fractal.koch_curve(size * 0.8 / 3, depth)
+
+
+def _tree(turtle, depth, size):
+    turtle.set_position((size / 2, size * 0.9))
+    turtle.set_angle(-90)
+    turtle.fractal.tree(size / 4, [-25, 25], min_size=size / 4 / 1.5 ** depth)
+
+
+GENERATORS = {
+    "lsystem.dragon": (_lsystem("dragon", 2), (8, 12, 16, 18)),
+    "lsystem.sierpinski_triangle": (_lsystem("sierpinski_triangle", 2), (4, 6, 8, 9)),
+    "lsystem.fractal_plant": (_lsystem("fractal_plant", 2), (4, 5, 6, 7)),
+    "lsystem.koch_curve_right_angle": (_lsystem("koch_curve_right_angle", 2), (3, 4, 5, 6)),
+    "lsystem.fractal_binary_tree": (_lsystem("fractal_binary_tree", 2), (6, 8, 10, 12)),
+    "figures.von_koch_curve_flake": (_flake, (4, 6, 8, 9)),
+    "figures.blanc_manger": (_blanc_manger, (8, 12, 16, 18)),
+    "turtle.outline": (_turtle(_outline), (3, 4, 5, 6)),
+    "turtle.dragon": (_turtle(_turtle_dragon), (8, 10, 12, 14)),
+    "turtle.koch_curve": (_turtle(_koch_curve), (3, 4, 5, 6)),
+    "turtle.tree": (_turtle(_tree), (6, 8, 10, 12)),
+}
+
+
+def measure(generator, depth, size, backend="pil"):
+    """Draw a generator and measure it, meant to run in a fresh process
+
+    The generator is drawn a first time without instrumentation for the wall time and the peak memory, then a second
+    time with stats for the number of segments and the time of each stage.
+
+    :param generator: Name of the generator, key of GENERATORS
+    :param depth: Recursion depth or number of iterations
+    :param size: Side of the image, in pixels
+    :param backend: Name of the backend, key of BACKENDS
+    :type generator: str
+    :type depth: int
+    :type size: int
+    :type backend: str
+
+    :return: Measurement with wall time in seconds, peak resident memory in kB, number of segments and stages
+    :rtype: dict"""
+    run = GENERATORS[generator][0]
+    start = time.perf_counter()
+    run(depth, size, None, backend)
+    wall_time = time.perf_counter() - start
+    peak_rss = None
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            peak_rss //= 1024
+    stats = Stats()
+    run(depth, size, stats, backend)
+    return {"generator": generator, "depth": depth, "size": size, "backend": backend, "wall_time": wall_time,
+            "peak_rss_kb": peak_rss, "segments": stats.counters["segments"], "stages": dict(stats.timings)}
+
+
+def benchmark(generators, sizes, repeat=1, max_depth=None, backend="pil"):
+    """Measure generators at each of their depths and each size, each measurement in a fresh process
+
+    :param generators: Names of the generators
+    :param sizes: Sides of the images, in pixels
+    :param repeat: Number of measurements for each depth and size
+    :param max_depth: Skip depths above it
+    :param backend: Name of the backend, key of BACKENDS
+    :type generators: list
+    :type sizes: list
+    :type repeat: int
+    :type max_depth: int
+    :type backend: str
+
+    :return: Generator of measurements
+    :rtype: generator"""
+    context = get_context("spawn")
+    for generator in generators:
+        for depth in GENERATORS[generator][1]:
+            if max_depth is not None and depth > max_depth:
+                continue
+            for size in sizes:
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        yield executor.submit(measure, generator, depth, size, backend).result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fractal generators")
+    parser.add_argument("--output", default="benchmark.jsonl", help="JSON lines file where results are appended")
+    parser.add_argument("--label", default="", help="Label of the measured version, stored with each result")
+    parser.add_argument("--generators", nargs="+", choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 4000], help="Sides of the images")
+    parser.add_argument("--repeat", type=int, default=1, help="Measurements for each depth and size")
+    parser.add_argument("--max-depth", type=int, default=None, help="Skip depths above it")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="pil",
+                        help="Where lines are drawn, null to measure geometry only")
+    arguments = parser.parse_args(argv)
+    with open(arguments.output, "a") as output:
+        for result in benchmark(arguments.generators, arguments.sizes, arguments.repeat, arguments.max_depth,
+                                arguments.backend):
+            result.update(label=arguments.label, timestamp=time.time(), python=sys.version.split()[0])
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            print("{generator:32} depth={depth:<3} size={size:<6} {wall_time:9.3f}s "
+                  "{peak_rss_kb} kB {segments} segments".format(**result))
+
+
+if __name__ == "__main__":
+    main()
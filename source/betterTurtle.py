@@ -18,15 +18,26 @@ A new turtle which is faster.
    :undoc-members:
 """
 
+import cmath
 import math
 import time
+from array import array
 
-from PIL import Image, ImageDraw
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+
+from backends import Backend, BoundsBackend, visible
+from profiling import segment_pixels, stage, touched_pixels
+from vector import open_vector
 
 
 class Figures:
     """A lot of function to create some well-know shapes
 
+    The recursive curves (koch_curve and outline) draw a part of the curve whose points all lie closer than the
+    detail of the turtle to its start as a single segment, so iterations beyond the resolution of the image cost
+    nothing.
+
     :param master: turtle2 to use for draw
     :type master: Turtle
 
@@ -51,6 +62,10 @@ class Figures:
 
         if number_of_iterations == 0:
             self.canvas.forward(length)
+            return
+        chord, radius = self._outline_extent(number_of_iterations, length, number_of_sides)
+        if radius * self.canvas.resolution < self.canvas.detail:
+            self.canvas.forward(chord)
         else:
             self._outline_trace(number_of_iterations - 1, length, number_of_sides)
             self.canvas.right(360. / number_of_sides)
@@ -62,6 +77,35 @@ class Figures:
             self.canvas.right(360. / number_of_sides)
             self._outline_trace(number_of_iterations - 1, length, number_of_sides)
 
+    @staticmethod
+    def _outline_extent(number_of_iterations, length, number_of_sides):
+        """Size of the outline of a recursive shape drawn by _outline_trace
+
+        A level puts five traces of the level below end to end, turned by 0, 1, 0, -1 and 0 sides, so its chord is
+        3 + 2 cos(side angle) times theirs and it does not go farther from its start than the farthest start of a
+        trace plus their own radius.
+
+        >>> Figures._outline_extent(2, 1, 4)
+        (9.0, 9.94427190999916)
+
+        :param number_of_iterations: Number of iteration used to draw
+        :param length: Size of a single side
+        :param number_of_sides: Number of sides of the initial shape
+        :type number_of_iterations: int
+        :type length: float
+        :type number_of_sides: int
+
+        :returns: The distance from the start to the end, and a bound of the distance from the start to any point
+        :rtype: tuple"""
+        turn = cmath.exp(1j * math.radians(360. / number_of_sides))
+        factor = 3 + 2 * turn.real
+        reach = max(abs(start) for start in (1, 1 + turn, 2 + turn, 2 + turn + turn.conjugate()))
+        if abs(factor - 1) < 1e-12:
+            chords = number_of_iterations
+        else:
+            chords = (factor ** number_of_iterations - 1) / (factor - 1)
+        return length * factor ** number_of_iterations, length * (1 + reach * chords)
+
     def regular_polygon(self, number_of_sides, length):
         """Draw a regular polygon
 
@@ -127,13 +171,13 @@ class Figures:
         if length < min_size:
             return ""
         else:
-            self.canvas._state["color"] = (int(length), int(length), int(length))
+            self.canvas.set_colour((int(length), int(length), int(length)))
             for angle in angles:
                 pos = self.canvas.get_position()
                 base_angle = self.canvas.get_angle()
                 self.canvas.right(angle)
                 self.canvas.forward(length)
-                self._tree(length / factor, angles, factor=factor, min_size=min_size)
+                self.tree(length / factor, angles, factor=factor, min_size=min_size)
                 self.canvas.set_position(pos)
                 self.canvas.set_angle(base_angle)
 
@@ -186,7 +230,25 @@ class Figures:
         self.canvas.forward(length)
 
     def koch_curve(self, length, number_of_iteration):
-        if number_of_iteration > 0:
+        """Draw the von koch curve
+
+        The curve goes from the pen to three times length ahead and lies in the disc whose diameter joins them.
+
+        >>> turtle = Turtle(size=(100, 100), resolution=1, recording=True)
+        >>> turtle.fractal.koch_curve(27, 50)
+        >>> len(turtle.segments())
+        1024
+
+        :param length: Length of the segments of the last iteration, a third of the curve when it is 0
+        :param number_of_iteration: Number of iteration for the curve
+        :type length: float
+        :type number_of_iteration: int
+
+        :returns: Nothing
+        :rtype: None"""
+        if 3 * length * self.canvas.resolution < self.canvas.detail:
+            self.canvas.forward(3 * length)
+        elif number_of_iteration > 0:
             self.koch_curve(length / 3., number_of_iteration - 1)
             self.canvas.left(60)
             self.koch_curve(length / 3., number_of_iteration - 1)
@@ -199,59 +261,125 @@ class Figures:
 
 
 class Turtle:
+    """Turtle drawing on a pillow image
+
+    The state is kept in slots and the heading vector is computed once per turn, so a step only costs a
+    multiply-add per coordinate and a draw call.
+
+    In recording mode, steps only append their segment to a buffer, which is drawn on the image by polylines when
+    flushed: on save, when the colour changes, before an immediate drawing and when the buffer is full.
+
+    With an output file, the image is a vector.VectorImage: lines are streamed to the file as SVG or PDF instead of
+    being drawn on a pillow image, and save closes the file. The output can also be any backends.Backend.
+
+    :param titre: Title of the drawing
+    :param size: Size of the drawing area
+    :param resolution: Number of pixels of the image for a unit of the drawing area
+    :param recording: Record segments instead of drawing them at each step
+    :param flush_threshold: Number of segments recorded before the buffer is flushed
+    :param stats: Optional profiling.Stats updated by the drawing and reported on save
+    :param output: SVG or PDF file where the drawing is streamed or backend, None to draw on a pillow image
+    :param detail: Size in pixels under which the recursive figures draw a single segment, 0 to always recurse
+    :type titre: str
+    :type size: tuple
+    :type resolution: int
+    :type recording: bool
+    :type flush_threshold: int
+    :type stats: profiling.Stats
+    :type output: str
+    :type detail: float"""
+    __slots__ = ("_config", "_x", "_y", "_angle", "_heading", "_colour", "fractal", "image", "draw", "resolution",
+                 "recording", "flush_threshold", "_buffer", "stats", "detail")
 
     @staticmethod
     def _calc_center(size):
         return size[0] / 2, size[1] / 2
 
     def _forward(self, distance):
-        AB = (distance * math.cos(math.radians(self._state.get("angle")))) + self._state.get("coordinate_x")
-        AC = (distance * math.sin(math.radians(self._state.get("angle")))) + self._state.get("coordinate_y")
-        self._forward_image(distance)
-        self._set_coordinates((AB, AC))
+        x = self._x + distance * self._heading[0]
+        y = self._y + distance * self._heading[1]
+        resolution = self.resolution
+        segment = (self._x * resolution, self._y * resolution, x * resolution, y * resolution)
+        if self.recording:
+            self._buffer.extend(segment)
+            if len(self._buffer) >= 4 * self.flush_threshold:
+                self.flush()
+        elif self.stats is None:
+            self.draw.line(segment, fill=self._colour)
+        else:
+            self._draw_line(segment)
+        self._x = x
+        self._y = y
+
+    def _draw_line(self, points):
+        """Draw a polyline and update the stats
 
-    def _forward_image(self, distance):
-        AB = (distance * math.cos(math.radians(self._state.get("angle")))) + self._state.get("coordinate_x")
-        AC = (distance * math.sin(math.radians(self._state.get("angle")))) + self._state.get("coordinate_y")
-        self.draw.line((self.get_position('x') * self.resolution, self.get_position('y') * self.resolution,
-                        AB * self.resolution, AC * self.resolution), fill=self._state.get("colour"))
+        :param points: Flat list of coordinates, in pixels of the image
+        :type points: list"""
+        if self.stats is not None:
+            self.stats.count("segments", len(points) // 2 - 1)
+            self.stats.count("pixels", touched_pixels(points))
+        with stage(self.stats, "rasterization"):
+            self.draw.line(points, fill=self._colour)
 
     def _turn(self, angle):
-        self._set_angle(self._state.get("angle") + angle)
+        self._set_angle(self._angle + angle)
 
     def _set_angle(self, angle):
-        self._state["angle"] = angle
-        while self._state.get("angle") >= 360:
-            self._state["angle"] = self._state.get("angle") - 360
+        """Set the heading, angles are only brought under 360 degrees: after a left turn the angle stays negative, the
+        rounding error of cos(-90) is positive while the one of cos(270) is negative and moves vertical lines left
+
+        >>> t = Turtle(size=(10, 10), resolution=1)
+        >>> t.set_position((2, 8)); t.forward(5); t.left(90); t.forward(5); t.flush()
+        >>> [t.image.getpixel((7, y)) for y in range(3, 9)] == [(0, 0, 0)] * 6
+        True
+
+        :param angle: Heading, in degrees
+        :type angle: float"""
+        while angle >= 360:
+            angle -= 360
+        self._angle = angle
+        radians = math.radians(angle)
+        self._heading = (math.cos(radians), math.sin(radians))
 
     def _clear(self):
         pass
 
     def _clear_img(self):
+        self._buffer = array('d')
         self.image = Image.new(
             '1', (self._config.get("size")), (255, 255, 255))
         self.draw = ImageDraw.Draw(self.image)
 
     def __init__(self, titre="Turtle", size=(
-            400, 400), resolution=10):
+            400, 400), resolution=10, recording=False, flush_threshold=65536, stats=None, output=None, detail=1):
         self._config = {"titre": titre,
                         "size": size,
                         "size_IMG": (size[0] * resolution, size[1] * resolution),
                         "center": self._calc_center(size),
                         }
-        self._state = {"angle": 0,
-                       "coordinate_x": self._config.get("center")[0],
-                       "coordinate_y": self._config.get("center")[1],
-                       "colour": (0, 0, 0),
-                       }
+        self._x, self._y = self._config.get("center")
+        self._set_angle(0)
+        self._colour = (0, 0, 0)
+        self._buffer = array('d')
+        self.recording = recording
+        self.flush_threshold = flush_threshold
+        self.stats = stats
+        self.detail = detail
         self.fractal = Figures(self)
-        self.image = Image.new(
-            'RGB',
-            (self._config.get("size_IMG")),
-            (255,
-             255,
-             255))
-        self.draw = ImageDraw.Draw(self.image)
+        if output is None:
+            self.image = Image.new(
+                'RGB',
+                (self._config.get("size_IMG")),
+                (255,
+                 255,
+                 255))
+            self.draw = ImageDraw.Draw(self.image)
+        elif isinstance(output, Backend):
+            self.image = self.draw = output
+        else:
+            self.image = self.draw = open_vector(output, self._config.get("size_IMG"), background=(255, 255, 255))
+        self._colour = self._ink(self._colour)
         self.resolution = resolution
 
     def forward(self, distance):
@@ -259,8 +387,6 @@ class Turtle:
 
     def backward(self, distance):
         self._forward(-distance)
-        if self.sauvegarde:
-            self._forward_image(-distance)
 
     def right(self, angle):
         self._turn(angle)
@@ -269,16 +395,17 @@ class Turtle:
         self._turn(-angle)
 
     def set_pixel(self, coordinate, colour):
-        self.draw.point(coordinate, colour if colour else self._state["colour"])
-
+        self.flush()
+        self.draw.point(coordinate, self._ink(colour) if colour else self._colour)
 
     def goto(self, coordinates):
+        self.flush()
         self._set_coordinates(coordinates)
         self.draw.line(coordinates)
 
     def _set_coordinates(self, coordinates):
-        self._state["coordinate_x"] = coordinates[0]
-        self._state["coordinate_y"] = coordinates[1]
+        self._x = coordinates[0]
+        self._y = coordinates[1]
 
     def clear(self):
         self._clear()
@@ -288,29 +415,136 @@ class Turtle:
 
     def get_position(self, type_coord=''):
         if type_coord == 'x':
-            return self._state.get("coordinate_x")
+            return self._x
         elif type_coord == "y":
-            return self._state.get("coordinate_y")
-        return self._state.get("coordinate_x"), self._state.get("coordinate_y")
+            return self._y
+        return self._x, self._y
 
     def set_angle(self, angle):
         self._set_angle(angle)
 
     def get_angle(self):
-        return self._state.get("angle")
+        return self._angle
+
+    @property
+    def colour(self):
+        return self._colour
+
+    @colour.setter
+    def colour(self, colour):
+        colour = self._ink(colour)
+        if colour != self._colour:
+            self.flush()
+            self._colour = colour
+
+    def set_colour(self, colour):
+        self.colour = colour
+
+    def _ink(self, colour):
+        """Colour in the mode of the image, red, green and blue (and alpha) colours are converted for the other modes
+
+        >>> from backends import RasterBackend
+        >>> turtle = Turtle(size=(4, 4), resolution=1, output=RasterBackend((4, 4), 'L'))
+        >>> turtle._ink((255, 0, 0)), turtle._ink("white"), Turtle(size=(4, 4), resolution=1)._ink([255, 0, 0])
+        (76, 255, (255, 0, 0))
+
+        :param colour: Colour as a tuple, a name or a value of the mode
+        :type colour: tuple
+
+        :return: The colour for the image
+        :rtype: tuple"""
+        if isinstance(colour, (tuple, list)) and len(colour) in (3, 4):
+            colour = "#" + "".join("{:02x}".format(int(component)) for component in colour)
+        if isinstance(colour, str):
+            return ImageColor.getcolor(colour, self.image.mode)
+        return colour
+
+    def segments(self):
+        """Segments recorded and not flushed yet
+
+        :returns: Array of segments (x0, y0, x1, y1) in pixels of the image
+        :rtype: numpy.ndarray"""
+        return np.array(self._buffer).reshape(-1, 4)
+
+    def flush(self):
+        """Draw the recorded segments on the image, consecutive segments are drawn as a single polyline
+
+        A backend gets all the segments as a single batch. On a pillow image, the segments which are wholly outside
+        the image are skipped.
+
+        :returns: Nothing
+        :rtype: None"""
+        if not self._buffer:
+            return
+        segments = self.segments()
+        self._buffer = array('d')
+        if isinstance(self.draw, Backend):
+            if self.stats is not None:
+                self.stats.count("segments", len(segments))
+                self.stats.count("pixels", segment_pixels(segments))
+            with stage(self.stats, self.draw.stage):
+                self.draw.segments(segments, self._colour)
+            return
+        segments = segments[visible(segments, self._config.get("size_IMG"))]
+        if not len(segments):
+            return
+        breaks = np.flatnonzero((segments[1:, :2] != segments[:-1, 2:]).any(axis=1)) + 1
+        for run in np.split(segments, breaks):
+            self._draw_line(np.concatenate((run[:, :2], run[-1:, 2:])).ravel().tolist())
+
+    @classmethod
+    def fit(cls, draw, margin=1, resolution=10, **kwargs):
+        """Draw on a new turtle whose drawing area is just large enough for the drawing
+
+        The drawing is measured first by a recording pass on a backends.BoundsBackend starting from (0, 0), then
+        drawn by a turtle of the size of its bounding box with a margin, starting so the drawing is at the top left
+        corner.
+
+        >>> turtle = Turtle.fit(lambda turtle: turtle.fractal.koch_curve(27, 3), resolution=1)
+        >>> from PIL import ImageOps
+        >>> turtle.image.size, ImageOps.invert(turtle.image).getbbox()
+        ((84, 26), (1, 1, 83, 25))
+
+        :param draw: Function drawing with the turtle given as argument
+        :param margin: Empty pixels around the drawing
+        :param resolution: Number of pixels of the image for a unit of the drawing area
+        :param kwargs: Other arguments of Turtle.__init__
+        :type draw: callable
+        :type margin: int
+        :type resolution: int
+
+        :return: The turtle, its segments are flushed
+        :rtype: Turtle"""
+        probe = cls(size=(0, 0), resolution=resolution, recording=True, output=BoundsBackend())
+        probe.set_position((0, 0))
+        draw(probe)
+        probe.flush()
+        left, top, right, bottom = probe.image.bounds or (0, 0, 0, 0)
+        pixels = (int(right - left + 0.5) + 2 * margin + 1, int(bottom - top + 0.5) + 2 * margin + 1)
+        size = (math.ceil(pixels[0] / resolution), math.ceil(pixels[1] / resolution))
+        turtle = cls(size=size, resolution=resolution, **kwargs)
+        turtle.set_position(((margin + 0.5 - left) / resolution, (margin + 0.5 - top) / resolution))
+        draw(turtle)
+        turtle.flush()
+        return turtle
 
     def get_state(self):
         text = ""
-        for i in self._state.items():
+        for i in (("angle", self._angle), ("coordinate_x", self._x), ("coordinate_y", self._y),
+                  ("colour", self._colour)):
             text = text + "\n" + str(i[0]) + ":" + str(i[1])
         return text
 
-    def save(self, path, type_img=None):
-        self.image.save(path, type_img)
+    def save(self, path=None, type_img=None):
+        self.flush()
+        with stage(self.stats, "encode"):
+            self.image.save(path, type_img)
+        if self.stats is not None:
+            self.stats.report()
 
 
 if __name__ == "__main__":
     t = Turtle(size=(10000, 10000), resolution=1)
     t.set_position((0, 0))
     t.fractal.outline(8, 40, 4)
-    t.save("D:\\Users\\louis chauvet\\Documents\\GitHub\\fractale\\test.bmp")
+    t.save("test.bmp")
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+"""
+Disk cache of encoded renders, addressed by a hash of everything which changes the image.
+
+>>> import tempfile
+>>> cache = RenderCache(tempfile.mkdtemp(), max_bytes=1 << 20)
+>>> data = cache.render("Figures.von_koch_curve_flake", ((50, 50), 40, 3), {"color": (255, 0, 0), "width": 1},
+...                     size=(100, 100))
+>>> cache.render("Figures.von_koch_curve_flake", ((50, 50), 40, 3), {"color": (255, 0, 0), "width": 1},
+...              size=(100, 100)) == data
+True
+>>> cache.hits, cache.misses
+(1, 1)
+"""
+
+import hashlib
+import inspect
+import io
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from PIL import Image
+
+import betterTurtle
+from backends import Backend, PilBackend
+from main import Figures, Lsystem
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+GENERATORS = {"Lsystem": Lsystem, "Figures": Figures, "Turtle": betterTurtle.Figures}
+
+
+def background_of(generator, background=None):
+    """Background of a render, when None white for the turtle which draws in black and black for the others
+
+    >>> background_of("Turtle.dragon"), background_of("Lsystem.dragon"), background_of("Turtle.dragon", (0, 0, 0))
+    ('white', 'black', (0, 0, 0))
+
+    :param generator: Name of the generator
+    :param background: Background color, None for the default of the generator
+    :type generator: str
+    :type background: tuple
+
+    :return: The background color
+    :rtype: tuple"""
+    if background is not None:
+        return tuple(background) if isinstance(background, list) else background
+    return "white" if generator.startswith("Turtle.") else "black"
+
+
+def draw(generator, args=(), kwargs=None, size=(1000, 1000), mode='RGB', background=None, position=None,
+         image=None, viewport=None, detail=None):
+    """Draw a generator on a new image
+
+    Turtle generators are drawn by a recording betterTurtle.Turtle with a pixel for a unit, on the size of the image or
+    on size for a backend without size like a backends.TransformBackend. Their kwargs can hold the color of the
+    turtle, black by default, converted for the mode of the image.
+
+    >>> image = draw("Turtle.koch_curve", (27, 2), {"color": [255, 0, 0]}, size=(40, 40), mode='L', position=(5, 20))
+    >>> image.getextrema()
+    (76, 255)
+
+    :param generator: Name of the generator, "Lsystem.<method>", "Figures.<method>" or "Turtle.<method>" for the
+        methods of betterTurtle.Figures
+    :param args: Positional arguments of the method
+    :param kwargs: Keyword arguments of the method
+    :param size: Size of the image
+    :param mode: Mode of the image
+    :param background: Background color of the image, None for background_of the generator
+    :param position: Start position of the pen, for Lsystem and Turtle
+    :param image: Pillow image or backends.Backend to draw on instead of a new image
+    :param viewport: Region (left, top, right, bottom) outside which Lsystem and Figures generate nothing
+    :param detail: Size under which the recursive figures are not divided anymore, in units of the drawing, None for
+        the default of the generator
+    :type generator: str
+    :type args: tuple
+    :type kwargs: dict
+    :type size: tuple
+    :type mode: str
+    :type background: tuple
+    :type position: tuple
+    :type image: Image.Image
+    :type viewport: tuple
+    :type detail: float
+
+    :return: The image
+    :rtype: Image.Image"""
+    if image is None:
+        image = Image.new(mode, tuple(size), background_of(generator, background))
+    class_name, method = generator.split(".")
+    if class_name == "Turtle":
+        turtle = betterTurtle.Turtle(size=image.size if all(image.size) else tuple(size), resolution=1, recording=True,
+                                     output=image if isinstance(image, Backend) else PilBackend(image))
+        if detail is not None:
+            turtle.detail = detail
+        if position is not None:
+            turtle.set_position(tuple(position))
+        kwargs = dict(kwargs or {})
+        if "color" in kwargs:
+            turtle.colour = kwargs.pop("color")
+        getattr(turtle.fractal, method)(*args, **kwargs)
+        turtle.flush()
+        return image
+    drawing = GENERATORS[class_name](image, viewport=viewport)
+    if detail is not None and class_name == "Figures":
+        drawing.detail = detail
+    if position is not None:
+        drawing.set_pos(*position)
+    getattr(drawing, method)(*args, **(kwargs or {}))
+    return image
+
+
+class RenderCache:
+    """Disk cache of encoded renders with a size-bounded LRU eviction
+
+    Entries are written in a temporary file and renamed, so readers never see a partial entry and several processes
+    can share the directory. A hit refreshes the modification time of the entry, eviction removes the least recently
+    used entries first.
+
+    :param directory: Directory of the cache, created if needed
+    :param max_bytes: Maximal size of the entries, in bytes
+    :type directory: str
+    :type max_bytes: int"""
+
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(**parameters):
+        """Hash the parameters of a render
+
+        >>> RenderCache.key(generator="Lsystem.dragon", args=[5, 12]) == RenderCache.key(args=(5, 12),
+        ...                                                                               generator="Lsystem.dragon")
+        True
+
+        :return: Hexadecimal SHA-256 of the parameters
+        :rtype: str"""
+        text = json.dumps(parameters, sort_keys=True, default=repr)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        """Read an entry
+
+        :param key: Key of the entry
+        :type key: str
+
+        :return: Stored data, None if the entry is not in the cache
+        :rtype: bytes"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as entry:
+                data = entry.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store an entry, then evict least recently used entries if the cache is larger than max_bytes
+
+        The size of the cache is kept up to date in the lock file, so the directory is only scanned again when the
+        cache is over max_bytes or when the size is lost.
+
+        >>> cache = RenderCache(tempfile.mkdtemp(), max_bytes=10)
+        >>> cache.put("a" * 64, b"123456"); cache.put("b" * 64, b"1234"); cache.put("b" * 64, b"123")
+        >>> cache.size()
+        9
+        >>> cache.put("c" * 64, b"12")
+        >>> cache.size(), cache.get("a" * 64), cache.get("c" * 64)
+        (5, None, b'12')
+
+        :param key: Key of the entry
+        :param data: Data to store
+        :type key: str
+        :type data: bytes"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as entry:
+                entry.write(data)
+            with self._lock() as lock:
+                try:
+                    replaced = os.stat(path).st_size
+                except FileNotFoundError:
+                    replaced = 0
+                os.replace(temporary, path)
+                total = self._read_size(lock)
+                if total is not None:
+                    total += len(data) - replaced
+                if total is None or total > self.max_bytes:
+                    total = self._evict()
+                self._write_size(lock, total)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+    @contextmanager
+    def _lock(self):
+        """Serialize writes between processes when the platform can lock files, the lock file holds the size"""
+        with open(os.path.join(self.directory, ".lock"), "a+") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield lock
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_size(lock):
+        lock.seek(0)
+        try:
+            return int(lock.read())
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _write_size(lock, total):
+        lock.seek(0)
+        lock.truncate()
+        lock.write(str(total))
+        lock.flush()
+
+    def size(self):
+        """Size of the entries, in bytes
+
+        :return: Size of the cache
+        :rtype: int"""
+        with self._lock() as lock:
+            total = self._read_size(lock)
+            if total is None:
+                total = self._evict()
+                self._write_size(lock, total)
+            return total
+
+    def evict(self):
+        """Scan the cache and remove least recently used entries until it fits in max_bytes"""
+        with self._lock() as lock:
+            self._write_size(lock, self._evict())
+
+    def _evict(self):
+        """Eviction without the lock
+
+        :return: Size of the remaining entries
+        :rtype: int"""
+        entries = []
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def render(self, generator, args=(), kwargs=None, size=(1000, 1000), mode='RGB', background=None,
+               position=None, format="PNG"):
+        """Return the encoded image of a render, drawing it only if it is not in the cache
+
+        The key covers the generator and its source code (so rules changes invalidate it), its arguments (colors,
+        widths...), the canvas and the output format. Parameters are the same than draw.
+
+        :param format: Format of the encoded image
+        :type format: str
+
+        :return: Encoded image
+        :rtype: bytes"""
+        class_name, method = generator.split(".")
+        try:
+            source = inspect.getsource(getattr(GENERATORS[class_name], method))
+        except (OSError, TypeError):
+            source = None
+        key = self.key(generator=generator, source=source, args=args, kwargs=kwargs, size=size, mode=mode,
+                       background=background, position=position, format=format)
+        data = self.get(key)
+        if data is None:
+            output = io.BytesIO()
+            draw(generator, args, kwargs, size, mode, background, position).save(output, format)
+            data = output.getvalue()
+            self.put(key, data)
+        return data
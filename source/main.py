@@ -1,9 +1,21 @@
 import cmath
-import copy
-from math import atan, cos, sin, pi
-
+import hashlib
+import mmap
+import os
+import tempfile
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from fractions import Fraction
+from math import cos, gcd, sin, pi
+
+import numpy as np
 from PIL import Image, ImageDraw
 
+from backends import Backend, BoundsBackend, PilBackend, visible
+from profiling import stage, touched_pixels
+
 """
 A lib to draw fractals on pillow image
 
@@ -16,6 +28,7 @@ A lib to draw fractals on pillow image
 
 class State:
     """State of Lsystem"""
+    __slots__ = ("x", "y", "angle", "color", "width")
     width: int
     color: tuple
     angle: int
@@ -48,10 +61,693 @@ class State:
         return self.__str__()
 
 
-class Lsystem(ImageDraw.ImageDraw):
+class StateStack:
+    """Stack of pen states, positions and angles in a preallocated array of floats and colors and widths in a list
+
+    >>> stack = StateStack(1)
+    >>> state = State()
+    >>> state.x, state.angle = 3, pi
+    >>> stack.push(state)
+    >>> stack.push(state)
+    >>> state.x, state.color = 5, (255, 0, 0)
+    >>> len(stack)
+    2
+    >>> stack.pop(state)
+    >>> state.x, state.angle, state.color, len(stack)
+    (3.0, 3.141592653589793, (255, 255, 255), 1)"""
+    __slots__ = ("_data", "_styles", "_size")
+    _data: array
+    _styles: list
+    _size: int
+
+    def __init__(self, capacity=1024):
+        """Initialisation of stack
+
+        :param capacity: Number of states preallocated, the stack grows by doubling when it is full
+        :type capacity: int"""
+        self._data = array('d', bytes(24 * max(capacity, 1)))
+        self._styles = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, state):
+        """Save state on top of stack
+
+        :param state: State to save
+        :type state: State"""
+        data = self._data
+        index = self._size * 3
+        if index == len(data):
+            data.extend(data)
+        data[index] = state.x
+        data[index + 1] = state.y
+        data[index + 2] = state.angle
+        self._styles.append((state.color, state.width))
+        self._size += 1
+
+    def pop(self, state):
+        """Restore state from top of stack
+
+        :param state: State to restore in place
+        :type state: State"""
+        if not self._size:
+            raise IndexError("pop from empty state stack")
+        self._size -= 1
+        data = self._data
+        index = self._size * 3
+        state.x = data[index]
+        state.y = data[index + 1]
+        state.angle = data[index + 2]
+        state.color, state.width = self._styles.pop()
+
+
+class Alphabet:
+    """Interning of the symbols of a L system into byte codes
+
+    Expanded L systems are held as bytes of codes, which take a byte per symbol, can be written to disk and can be
+    read as NumPy arrays for vectorized passes.
+
+    >>> alphabet = Alphabet("F+-")
+    >>> alphabet.encode("F+F-")
+    b'\\x00\\x01\\x00\\x02'
+    >>> alphabet.decode(b'\\x02\\x00')
+    '-F'
+    >>> Alphabet.of("X", {"X": "F+[X]", "F": "FF"}).symbols
+    ['+', 'F', 'X', '[', ']']"""
+    __slots__ = ("symbols", "codes", "_translation")
+    symbols: list
+    codes: dict
+
+    def __init__(self, symbols):
+        """Initialisation of alphabet
+
+        :param symbols: Symbols of the alphabet, the code of a symbol is its index
+        :type symbols: iterable"""
+        self.symbols = list(dict.fromkeys(symbols))
+        if len(self.symbols) > 256:
+            raise ValueError("an alphabet can not hold more than 256 symbols")
+        self.codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+        self._translation = str.maketrans({symbol: chr(code) for code, symbol in enumerate(self.symbols)})
+
+    @classmethod
+    def of(cls, start, replacement):
+        """Alphabet of all the symbols which can appear in the expansion of a L system
+
+        :param start: Axiome
+        :param replacement: Dictionary which contain replacement values
+        :type start: str
+        :type replacement: dict
+
+        :return: The alphabet, with symbols sorted
+        :rtype: Alphabet"""
+        return cls(sorted(set(start).union(replacement, *replacement.values())))
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def encode(self, text):
+        """Encode symbols into codes
+
+        :param text: Symbols to encode, all of them must be in the alphabet
+        :type text: str
+
+        :return: Codes of the symbols
+        :rtype: bytes"""
+        return text.translate(self._translation).encode('latin-1')
+
+    def decode(self, data):
+        """Decode codes into symbols
+
+        :param data: Codes to decode
+        :type data: bytes
+
+        :return: The symbols
+        :rtype: str"""
+        return ''.join([self.symbols[code] for code in data])
+
+
+class ExpansionCache:
+    """Memory cache of expanded L systems, keyed by axiom and rules
+
+    Expansions are memoized for each symbol and depth: a symbol at depth n + 1 is built from the cached depth n of
+    the symbols of its replacement, so it is expanded once per depth whatever its number of occurrences, and a
+    deeper render reuses every expansion of the previous ones. Least recently used expansions are evicted when the
+    cache holds more than max_symbols symbols.
+
+    An expansion longer than max_symbols is not held in memory: if a directory is given, it is streamed to a file of
+    this directory and returned memory-mapped, so drawing it only keeps the pages being read in memory. Files are
+    named after the axiom, the rules and the depth, so they are reused by later renders and by other processes, and
+    they are kept until removed by hand.
+
+    >>> cache = ExpansionCache()
+    >>> alphabet = Alphabet.of("F-G-G", {"F": "F-G+F+G-F", "G": "GG"})
+    >>> alphabet.decode(cache.expand("F-G-G", {"F": "F-G+F+G-F", "G": "GG"}, 1, alphabet))
+    'F-G+F+G-F-GG-GG'
+    >>> alphabet.decode(cache.expand("F-G-G", {"F": "F-G+F+G-F", "G": "GG"}, 2)) == ''.join(
+    ...     Lsystem.expand("F-G-G", {"F": "F-G+F+G-F", "G": "GG"}, 2))
+    True"""
+    max_symbols: int
+    size: int
+
+    def __init__(self, max_symbols=1 << 26, directory=None):
+        """Initialisation of cache
+
+        :param max_symbols: Maximal number of symbols kept in the cache
+        :param directory: Directory where longer expansions are memory-mapped, None to expand them in memory
+        :type max_symbols: int
+        :type directory: str"""
+        self.max_symbols = max_symbols
+        self.directory = directory
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def expand(self, start, replacement, nb_recursive, alphabet=None):
+        """Expand a L system, using and filling the cache
+
+        :param start: Axiome
+        :param replacement: Dictionary which contain replacement values (F->F+F-F-F+F)
+        :param nb_recursive: Number of recursion
+        :param alphabet: Alphabet used to encode the symbols, Alphabet.of(start, replacement) if None
+        :type start: str
+        :type replacement: dict
+        :type nb_recursive: int
+        :type alphabet: Alphabet
+
+        :return: The expanded L system, encoded with alphabet
+        :rtype: bytes or mmap.mmap"""
+        if alphabet is None:
+            alphabet = Alphabet.of(start, replacement)
+        rules = (tuple(alphabet.symbols), tuple(sorted(replacement.items())))
+        key = (rules, start, nb_recursive)
+        if self.directory is not None and Lsystem.length(alphabet, start, replacement, nb_recursive) > self.max_symbols:
+            return self._mapped(key, alphabet, start, replacement, nb_recursive)
+        expanded = self._get(key)
+        if expanded is None:
+            codes = {alphabet.codes[symbol]: alphabet.encode(value) for symbol, value in replacement.items()}
+            expanded = b''.join([self._symbol(rules, codes, code, nb_recursive) for code in alphabet.encode(start)])
+            self._put(key, expanded)
+        return expanded
+
+    def _symbol(self, rules, codes, code, depth):
+        """Expansion of a single symbol
+
+        :param rules: Hashable form of the alphabet and the replacement
+        :param codes: Dictionary which contain encoded replacement values of each code
+        :param code: Code of the symbol to expand
+        :param depth: Number of recursion
+        :type rules: tuple
+        :type codes: dict
+        :type code: int
+        :type depth: int
+
+        :return: The expanded symbol
+        :rtype: bytes"""
+        if depth == 0 or code not in codes:
+            return bytes((code,))
+        key = (rules, code, depth)
+        expanded = self._get(key)
+        if expanded is None:
+            expanded = b''.join([self._symbol(rules, codes, item, depth - 1) for item in codes[code]])
+            self._put(key, expanded)
+        return expanded
+
+    def _mapped(self, key, alphabet, start, replacement, nb_recursive):
+        """Expansion streamed to a file of the directory, then memory-mapped
+
+        :param key: Hashable form of the alphabet, the rules, the axiom and the depth
+        :type key: tuple
+
+        :return: The expanded L system, encoded with alphabet
+        :rtype: mmap.mmap"""
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        path = os.path.join(self.directory, name + ".lsystem")
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            try:
+                with os.fdopen(descriptor, "wb") as output:
+                    for chunk in Lsystem.encoded(alphabet, start, replacement, nb_recursive):
+                        output.write(chunk)
+                os.replace(temporary, path)
+            except BaseException:
+                os.unlink(temporary)
+                raise
+        with open(path, "rb") as expanded:
+            return mmap.mmap(expanded.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _get(self, key):
+        expanded = self._entries.get(key)
+        if expanded is not None:
+            self._entries.move_to_end(key)
+        return expanded
+
+    def _put(self, key, expanded):
+        if len(expanded) > self.max_symbols:
+            return
+        self._entries[key] = expanded
+        self.size += len(expanded)
+        while self.size > self.max_symbols:
+            self.size -= len(self._entries.popitem(last=False)[1])
+
+    def clear(self):
+        """Remove all expansions"""
+        self._entries.clear()
+        self.size = 0
+
+
+class Action:
+    """Action of the pen bound to a symbol of a L system
+
+    An action is called like a function, its kind and value let the L system compile runs of symbols at once.
+
+    >>> action = Action("turn", pi, lambda: None)
+    >>> action.kind, action.value
+    ('turn', 3.141592653589793)"""
+    __slots__ = ("kind", "value", "function")
+    kind: str
+    value: float
+    function: object
+
+    def __init__(self, kind, value, function):
+        """Initialisation of action
+
+        :param kind: Kind of action, one of "forward", "turn", "save", "restore" or "nothing"
+        :param value: Distance to forward or angle to turn (to left), None for other kinds
+        :param function: Function which apply the action on the pen
+        :type kind: str
+        :type value: float
+        :type function: callable"""
+        self.kind = kind
+        self.value = value
+        self.function = function
+
+    def __call__(self):
+        return self.function()
+
+
+def _render_tile(tile, mode, lines):
+    """Draw lines on a tile, lines must already be shifted in the tile coordinates
+
+    :param tile: Part of the image to draw on
+    :param mode: Mode used for color values
+    :param lines: List of (points, args, kwargs) to give to ImageDraw.line
+    :type tile: Image.Image
+    :type mode: str
+    :type lines: list
+
+    :return: The tile with lines drawn on it
+    :rtype: Image.Image"""
+    draw = ImageDraw.Draw(tile, mode)
+    for points, args, kwargs in lines:
+        draw.line(points.ravel().tolist(), *args, **kwargs)
+    return tile
+
+
+class Canvas(ImageDraw.ImageDraw):
+    """Image draw which can record lines and rasterize them by tiles in a pool of processes
+
+    Lines are given to a backend: the image can be a backends.Backend, like a backends.RasterBackend or a
+    vector.VectorImage, a pillow image is drawn on with a backends.PilBackend. Only pillow images can be tiled, the
+    other backends only draw lines and points: the other methods of ImageDraw raise a TypeError on them.
+
+    When cull is True, the segments of the polylines of the generators which are wholly outside the image are skipped
+    before they reach the backend. With a viewport, the generators which support it (Lsystem.draw_l,
+    Figures.von_koch_curve and Figures.von_koch_curve_flake) do not even compute the parts of the fractal which can
+    not meet the viewport, so a zoom on a small region of a deep fractal costs about its visible detail. The skipped
+    parts are jumped over with sums of moves added in another order than the full drawing, so an Lsystem is only drawn
+    pixel for pixel like without viewport when its steps and headings are exact in binary (see Lsystem.draw_l).
+
+    >>> img = Image.new('L', (64, 64))
+    >>> canvas = Canvas(img)
+    >>> with canvas.tiled(tile_size=16, workers=1):
+    ...     canvas.line([(0, 0), (63, 63)], 255, 1)
+    >>> img.getpixel((40, 40))
+    255"""
+    image: Image.Image
+    backend: Backend
+    recorded: list
+    stats: object
+    cull: bool = True
+    viewport: tuple = None
+
+    def __init__(self, im, mode=None, stats=None, viewport=None):
+        """Initialisation
+
+        Parameters are the same than ImageDraw.__init__, im can also be a backends.Backend, stats is an optional
+        profiling.Stats updated by the renders and reported at the end of each of them, viewport an optional region
+        (left, top, right, bottom) in pixels outside which nothing is generated, usually (0, 0) and the image size."""
+        if isinstance(im, Backend):
+            super().__init__(Image.new(im.mode, (1, 1)), mode)
+            self.backend = im
+        else:
+            super().__init__(im, mode)
+            self.backend = PilBackend(im, mode)
+        self.image = im
+        self.recorded = None
+        self.stats = stats
+        self.viewport = viewport
+
+    @staticmethod
+    def _width(args, kwargs):
+        """Width of a line from the arguments of ImageDraw.line
+
+        :return: The line width, in pixels
+        :rtype: int"""
+        return kwargs.get("width", args[1] if len(args) > 1 else 1)
+
+    def line(self, xy, *args, **kwargs):
+        """Draw a line, or record it when inside a tiled block
+
+        >>> img = Image.new('L', (16, 16))
+        >>> Canvas(img).line([(0, 0), (10, 10)], 255)
+        >>> img.getpixel((5, 5))
+        255
+
+        Parameters are the same than ImageDraw.line"""
+        if self.stats is not None:
+            self.stats.count("segments", max(np.size(xy) // 2 - 1, 0))
+            self.stats.count("pixels", touched_pixels(xy, self._width(args, kwargs)))
+        if self.recorded is None:
+            with stage(self.stats, self.backend.stage):
+                return self.backend.line(xy, *args, **kwargs)
+        self.recorded.append((np.asarray(xy, dtype=float).reshape(-1, 2), args, kwargs))
+
+    def point(self, xy, fill=None):
+        """Draw points on the backend
+
+        >>> from backends import RasterBackend
+        >>> canvas = Canvas(RasterBackend((10, 10), 'L'))
+        >>> canvas.point([(2, 3)], 255)
+        >>> canvas.backend.to_image().getpixel((2, 3))
+        255
+        >>> canvas.rectangle((0, 0, 5, 5), 255)
+        Traceback (most recent call last):
+        ...
+        TypeError: Canvas.rectangle draws on pillow images only, not on a RasterBackend
+
+        Parameters are the same than ImageDraw.point"""
+        with stage(self.stats, self.backend.stage):
+            self.backend.point(xy, fill)
+
+    def _polyline(self, points, fill, width):
+        """Draw a polyline given as complex points, without its segments which are outside the image
+
+        >>> from backends import NullBackend
+        >>> canvas = Canvas(NullBackend((10, 10)))
+        >>> canvas._polyline(np.array([-20 - 20j, -10 - 10j, 5 + 5j, 8 + 5j, 30 + 5j, 40 + 5j, 8 + 8j]), 255, 1)
+        >>> canvas.backend.polylines, canvas.backend.segment_count
+        (2, 4)
+
+        :param points: Points as complex numbers
+        :param fill: Color of the line
+        :param width: The line width, in pixels
+        :type points: numpy.ndarray
+        :type fill: tuple
+        :type width: int"""
+        if not self.cull or not all(self.backend.size):
+            self.line(self._flat(points), fill, width)
+            return
+        points = np.column_stack((points.real, points.imag))
+        segments = np.column_stack((points[:-1], points[1:]))
+        shown = visible(segments, self.backend.size, (width or 1) + 1)
+        if shown.all():
+            self.line(points.ravel().tolist(), fill, width)
+        elif shown.any():
+            for run in Backend._runs(segments[shown]):
+                self.line(run.ravel().tolist(), fill, width)
+
+    def _polylines(self, starts, ends, fill, width):
+        """Draw segments given as complex points, consecutive segments as a single polyline
+
+        :param starts: First points of the segments as complex numbers
+        :param ends: Last points of the segments as complex numbers
+        :param fill: Color of the lines
+        :param width: The line width, in pixels
+        :type starts: numpy.ndarray
+        :type ends: numpy.ndarray
+        :type fill: tuple
+        :type width: int"""
+        if not len(starts):
+            return
+        breaks = (np.flatnonzero(starts[1:] != ends[:-1]) + 1).tolist()
+        for first, last in zip([0] + breaks, breaks + [len(starts)]):
+            self._polyline(np.append(starts[first:last], ends[last - 1]), fill, width)
+
+    @staticmethod
+    def _grown(viewport, width):
+        """Viewport grown by the margin of lines of width pixels, lines may touch it from outside"""
+        margin = (width or 1) + 1
+        left, top, right, bottom = viewport
+        return left - margin, top - margin, right + margin, bottom + margin
+
+    @staticmethod
+    def _meets(centers, radius, viewport):
+        """Tell which discs meet a viewport
+
+        >>> Canvas._meets(np.array([5 + 5j, 20 + 5j, 13 + 13j]), np.array([1, 5, 5]), (0, 0, 10, 10))
+        array([ True, False,  True])
+
+        :param centers: Centers of the discs as complex numbers
+        :param radius: Radius of the discs
+        :param viewport: Region (left, top, right, bottom)
+        :type centers: numpy.ndarray
+        :type radius: numpy.ndarray
+        :type viewport: tuple
+
+        :return: Boolean array, True for the discs which meet the viewport
+        :rtype: numpy.ndarray"""
+        left, top, right, bottom = viewport
+        x = np.maximum(np.maximum(left - centers.real, centers.real - right), 0)
+        y = np.maximum(np.maximum(top - centers.imag, centers.imag - bottom), 0)
+        return x * x + y * y <= radius * radius
+
+    def _outside(self, xs, ys, width):
+        """Tell if a polyline is wholly outside the image
+
+        :param xs: x coordinates of the points
+        :param ys: y coordinates of the points
+        :param width: The line width, in pixels
+        :type xs: list
+        :type ys: list
+        :type width: int
+
+        :rtype: bool"""
+        if not self.cull or not all(self.backend.size):
+            return False
+        margin = (width or 1) + 1
+        size_x, size_y = self.backend.size
+        return (max(xs) < -margin or min(xs) >= size_x + margin or
+                max(ys) < -margin or min(ys) >= size_y + margin)
+
+    @classmethod
+    def bounds(cls, draw, **kwargs):
+        """Bounding box of a drawing, drawn on a backends.BoundsBackend without rasterization
+
+        >>> [round(value, 2) for value in Figures.bounds(lambda figures: figures.von_koch_curve((10, 50), (90, 50), 2))]
+        [10.0, 50.0, 90.0, 73.09]
+
+        :param draw: Function drawing on the canvas given as argument
+        :param kwargs: Other arguments of the canvas, stats are not updated by the measure
+        :type draw: callable
+
+        :return: The bounding box (left, top, right, bottom) in pixels, None if nothing is drawn
+        :rtype: tuple"""
+        kwargs.pop("stats", None)
+        backend = BoundsBackend()
+        draw(cls(backend, **kwargs))
+        return backend.bounds
+
+    def save_image(self, fp=None, format=None, **params):
+        """Encode the image, timed as the encode stage
+
+        Parameters are the same than Image.save, see Backend.save"""
+        with stage(self.stats, "encode"):
+            self.backend.save(fp, format, **params)
+        self._report()
+
+    def progressive(self, draw, depth, callback=None, first=1):
+        """Draw the depths first to depth one after another on the image, each one replacing the previous one
+
+        The image is restored as it was before the first depth before drawing each next depth, and callback is called
+        with the image after each depth, so a preview is shown after the first depths, which are fast, while deeper
+        ones are drawn. The backend must implement to_image, snapshot and restore.
+
+        >>> figures = Figures(Image.new('L', (100, 100)))
+        >>> figures.progressive(lambda depth: figures.von_koch_curve((10, 50), (90, 50), depth, color=255, width=1), 6,
+        ...                     lambda image, depth: depth < 3)
+        3
+
+        :param draw: Function drawing a depth, called with the depth
+        :param depth: Last depth to draw
+        :param callback: Function called with the image and the depth after each depth, returning False cancels the
+            next depths
+        :param first: First depth to draw
+        :type draw: callable
+        :type depth: int
+        :type callback: callable
+        :type first: int
+
+        :return: The last depth drawn
+        :rtype: int"""
+        background = self.backend.snapshot()
+        for level in range(first, depth + 1):
+            if level > first:
+                self.backend.restore(background)
+            draw(level)
+            if callback is not None and callback(self.backend.to_image(), level) is False:
+                return level
+        return depth
+
+    def _report(self):
+        """Report the stats at the end of a render"""
+        if self.stats is not None:
+            self.stats.report()
+
+    @staticmethod
+    def _flat(points):
+        """Flatten complex points into the list of coordinates expected by ImageDraw.line
+
+        >>> Canvas._flat(np.array([1 + 2j, 3 + 4j]))
+        [1.0, 2.0, 3.0, 4.0]
+
+        :param points: Points as complex numbers
+        :type points: numpy.ndarray
+
+        :return: List [x0, y0, x1, y1, ...]
+        :rtype: list"""
+        return np.column_stack((points.real, points.imag)).ravel().tolist()
+
+    @contextmanager
+    def tiled(self, tile_size=1024, workers=None):
+        """Record lines drawn inside the block and rasterize them by tiles in parallel at the end of the block
+
+        Coordinates are truncated like Pillow does before being shifted in each tile, so thin lines are the same than
+        drawn directly on the image. Wide lines are drawn by Pillow with floating point polygons and can differ on
+        a few pixels.
+
+        :param tile_size: Size of the side of a tile, in pixels
+        :param workers: Number of processes, defaults to the number of CPUs, 1 to render in the current process
+        :type tile_size: int
+        :type workers: int"""
+        if not isinstance(self.backend, PilBackend):
+            yield self
+            return
+        self.recorded = []
+        try:
+            yield self
+            lines = self.recorded
+        finally:
+            self.recorded = None
+        self.render_tiles(lines, tile_size, workers)
+
+    def render_tiles(self, lines, tile_size=1024, workers=None):
+        """Rasterize recorded lines by tiles and paste the tiles back on the image
+
+        Each tile is drawn with a border as large as the widest line, so Pillow never clips a line near the visible
+        part of the tile.
+
+        :param lines: List of (points, args, kwargs) recorded by line
+        :param tile_size: Size of the side of a tile, in pixels
+        :param workers: Number of processes, defaults to the number of CPUs, 1 to render in the current process
+        :type lines: list
+        :type tile_size: int
+        :type workers: int"""
+        with stage(self.stats, "rasterization"):
+            self._render_tiles(lines, tile_size, workers)
+
+    def _render_tiles(self, lines, tile_size, workers):
+        """Rasterize recorded lines by tiles, see render_tiles"""
+        lines = [(np.trunc(points), args, kwargs) for points, args, kwargs in lines if len(points) > 1]
+        if not lines:
+            return
+        margins = np.array([(self._width(args, kwargs) or 1) + 1 for points, args, kwargs in lines])
+        owners = np.repeat(np.arange(len(lines)), [len(points) - 1 for points, args, kwargs in lines])
+        starts = np.concatenate([points[:-1] for points, args, kwargs in lines])
+        ends = np.concatenate([points[1:] for points, args, kwargs in lines])
+        pad = int(margins.max())
+        margin = margins[owners][:, None]
+        low = np.minimum(starts, ends) - margin
+        high = np.maximum(starts, ends) + margin
+        width, height = self.image.size
+        jobs = []
+        for top in range(0, height, tile_size):
+            for left in range(0, width, tile_size):
+                box = (left, top, min(left + tile_size, width), min(top + tile_size, height))
+                visible = np.flatnonzero((high[:, 0] >= box[0]) & (low[:, 0] < box[2])
+                                         & (high[:, 1] >= box[1]) & (low[:, 1] < box[3]))
+                if not len(visible):
+                    continue
+                padded = (max(box[0] - pad, 0), max(box[1] - pad, 0),
+                          min(box[2] + pad, width), min(box[3] + pad, height))
+                breaks = np.flatnonzero((np.diff(visible) != 1) | (np.diff(owners[visible]) != 0)) + 1
+                tile_lines = []
+                for run in np.split(visible, breaks):
+                    points = np.concatenate((starts[run], ends[run[-1:]])) - padded[:2]
+                    tile_lines.append((points, lines[owners[run[0]]][1], lines[owners[run[0]]][2]))
+                jobs.append((box, padded, tile_lines))
+        if workers is None:
+            workers = os.cpu_count()
+        if workers <= 1 or len(jobs) <= 1:
+            for box, padded, tile_lines in jobs:
+                self._paste_tile(_render_tile(self.image.crop(padded), self.mode, tile_lines), box, padded)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_render_tile, self.image.crop(padded), self.mode, tile_lines): (box, padded)
+                       for box, padded, tile_lines in jobs}
+            for future in as_completed(futures):
+                self._paste_tile(future.result(), *futures[future])
+
+    def _paste_tile(self, tile, box, padded):
+        """Paste the visible part of a rendered tile on the image
+
+        :param tile: Tile rendered with its border
+        :param box: Box (left, top, right, bottom) of the visible part on the image
+        :param padded: Box of the tile with its border on the image
+        :type tile: Image.Image
+        :type box: tuple
+        :type padded: tuple"""
+        self.image.paste(tile.crop((box[0] - padded[0], box[1] - padded[1],
+                                    box[2] - padded[0], box[3] - padded[1])), box[:2])
+
+
+def _pillow_only(name):
+    """Method of ImageDraw for Canvas, which raises a TypeError when the backend does not draw on a pillow image
+
+    :param name: Name of the method
+    :type name: str
+
+    :return: The method
+    :rtype: function"""
+    method = getattr(ImageDraw.ImageDraw, name)
+
+    def pillow_only(self, *args, **kwargs):
+        if not isinstance(self.backend, PilBackend):
+            raise TypeError("Canvas.{} draws on pillow images only, not on a {}".format(name,
+                                                                                      type(self.backend).__name__))
+        return method(self, *args, **kwargs)
+
+    pillow_only.__name__ = name
+    pillow_only.__doc__ = method.__doc__
+    return pillow_only
+
+
+for _name in ("arc", "bitmap", "chord", "circle", "ellipse", "multiline_text", "pieslice", "polygon",
+              "rectangle", "regular_polygon", "rounded_rectangle", "shape", "text"):
+    if hasattr(ImageDraw.ImageDraw, _name):
+        setattr(Canvas, _name, _pillow_only(_name))
+
+
+class Lsystem(Canvas):
     """Draw a L system"""
     state: State
-    states: list
+    states: StateStack
+    expansion_cache: ExpansionCache
+    headings: np.ndarray = None
+    chunk_size: int = 65536
+    block_size: int = 4096
+    vector_threshold: int = 64
 
     def dragon(self, size, recursions, color=None, width=0):
         """Trace Dragon curve
@@ -164,13 +860,63 @@ class Lsystem(ImageDraw.ImageDraw):
                     color, width)
 
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, expansion_cache=None, **kwargs):
         """Initialisation
 
-        Parameters are the same than ImageDraw.__init__"""
+        Parameters are the same than Canvas.__init__, expansion_cache is an optional ExpansionCache used to expand
+        the L systems instead of streaming them, it can be shared between drawings."""
         super().__init__(*args, **kwargs)
-        self.states = []
+        self.states = StateStack()
         self.state = State()
+        self.expansion_cache = expansion_cache
+
+    def progressive(self, draw, depth, callback=None, first=1):
+        """Draw the depths first to depth one after another, see Canvas.progressive
+
+        The pen goes back to its position and angle before each depth. With an expansion cache, each depth reuses
+        the expansions of the previous ones.
+
+        >>> lsystem = Lsystem(Image.new('L', (100, 100)))
+        >>> lsystem.set_pos(50, 50)
+        >>> lsystem.progressive(lambda depth: lsystem.dragon(2, depth, color=255, width=1), 8)
+        8"""
+        x, y, angle = self.state.x, self.state.y, self.state.angle
+
+        def level(recursions):
+            self.state.x, self.state.y, self.state.angle = x, y, angle
+            draw(recursions)
+
+        return super().progressive(level, depth, callback, first)
+
+    @classmethod
+    def fit(cls, draw, margin=1, mode='RGB', background=0, **kwargs):
+        """Draw a L system on a new image just large enough for it
+
+        The drawing is measured first by a pass without rasterization starting from (0, 0), then drawn on an image of
+        the size of its bounding box with a margin, with the pen moved so the drawing starts at the top left corner.
+
+        >>> lsystem = Lsystem.fit(lambda lsystem: lsystem.dragon(4, 8, color=255, width=1), mode='L')
+        >>> lsystem.image.size, lsystem.image.getbbox()
+        ((95, 63), (1, 1, 94, 62))
+
+        :param draw: Function drawing on the L system given as argument
+        :param margin: Empty pixels around the drawing
+        :param mode: Mode of the image
+        :param background: Background color of the image
+        :param kwargs: Other arguments of Lsystem.__init__, an expansion cache is shared by both passes
+        :type draw: callable
+        :type margin: int
+        :type mode: str
+        :type background: tuple
+
+        :return: The L system, drawn on its image
+        :rtype: Lsystem"""
+        left, top, right, bottom = cls.bounds(draw, **kwargs) or (0, 0, 0, 0)
+        size = (int(right - left + 0.5) + 2 * margin + 1, int(bottom - top + 0.5) + 2 * margin + 1)
+        lsystem = cls(Image.new(mode, size, background), **kwargs)
+        lsystem.set_pos(margin + 0.5 - left, margin + 0.5 - top)
+        draw(lsystem)
+        return lsystem
 
     def set_pos(self, x, y):
         """Set position of pen
@@ -220,15 +966,40 @@ class Lsystem(ImageDraw.ImageDraw):
 
     def _save(self):
         """Save state of pen"""
-        self.states.append(copy.deepcopy(self.state))
+        self.states.push(self.state)
+        if self.stats is not None:
+            self.stats.count("pushes")
 
     def _restore(self):
         """Restore last pen state"""
-        self.state = self.states.pop()
+        self.states.pop(self.state)
+        if self.stats is not None:
+            self.stats.count("pops")
 
     def draw_l(self, start, replacement, constants, nb_recursive, color=(255, 255, 255), width=0):
         """Draw a L system
 
+        With a viewport, the subtrees of the rewrite tree which can not meet it are skipped, see _pruned. The pen
+        jumps over them by sums of moves added in another order than the cumulative sums of the full drawing, so the
+        drawing is the same pixel for pixel only when the steps and the heading vectors are exact in binary, like the
+        integer steps of the dragon. Otherwise, the rounding differs and some points on the edge of a pixel move to
+        the next one.
+
+        >>> def dragon(viewport):
+        ...     lsystem = Lsystem(Image.new('L', (100, 100)), viewport=viewport)
+        ...     lsystem.set_pos(50, 50)
+        ...     lsystem.dragon(2, 16, color=255, width=1)
+        ...     return lsystem.image
+        >>> dragon((0, 0, 100, 100)).tobytes() == dragon(None).tobytes()
+        True
+        >>> def sierpinski(viewport):
+        ...     lsystem = Lsystem(Image.new('L', (100, 100)), viewport=viewport)
+        ...     lsystem.set_pos(5, 90)
+        ...     lsystem.sierpinski_triangle(0.7, 7, color=255, width=1)
+        ...     return np.asarray(lsystem.image)
+        >>> int((sierpinski((0, 0, 100, 100)) != sierpinski(None)).sum()), int((sierpinski(None) > 0).sum())
+        (3, 525)
+
         :param start: Axiome
         :param replacement: Dictionary which contain replacement values (F->F+F-F-F+F)
         :param constants: Dictionary which contain all elements with there function
@@ -244,77 +1015,730 @@ class Lsystem(ImageDraw.ImageDraw):
         """
         self.state.color = color
         self.state.width = width
-        for i in range(nb_recursive):
-            newstart = ""
-            for carac in start:
-                if carac in replacement:
-                    newstart += replacement[carac]
+        alphabet = Alphabet.of(start, replacement)
+        if self.viewport is not None:
+            chunks = self._pruned(alphabet, start, replacement, constants, nb_recursive,
+                                  self._grown(self.viewport, width))
+        elif self.expansion_cache is None:
+            chunks = self.encoded(alphabet, start, replacement, nb_recursive, self.chunk_size, self.block_size)
+        else:
+            with stage(self.stats, "expansion"):
+                expanded = memoryview(self.expansion_cache.expand(start, replacement, nb_recursive, alphabet))
+            chunks = (expanded[index:index + self.chunk_size] for index in range(0, len(expanded), self.chunk_size))
+        with stage(self.stats, "expansion"):
+            self._compile(chunks, constants, alphabet)
+        self._report()
+
+    @staticmethod
+    def _lengths(alphabet, rules, nb_recursive):
+        """Length of the expansion of each code at each depth
+
+        :param alphabet: Alphabet used to encode the symbols
+        :param rules: Dictionary which contain encoded replacement values of each code
+        :param nb_recursive: Number of recursion
+        :type alphabet: Alphabet
+        :type rules: dict
+        :type nb_recursive: int
+
+        :return: Lengths, indexed by depth then by code
+        :rtype: list"""
+        lengths = [[1] * len(alphabet)]
+        for depth in range(nb_recursive):
+            lengths.append([sum(lengths[-1][item] for item in rules[code]) if code in rules else 1
+                            for code in range(len(alphabet))])
+        return lengths
+
+    @staticmethod
+    def length(alphabet, start, replacement, nb_recursive):
+        """Number of symbols of an expanded L system, without expanding it
+
+        >>> alphabet = Alphabet.of("FX", {"X": "X+YF+", "Y": "-FX-Y"})
+        >>> Lsystem.length(alphabet, "FX", {"X": "X+YF+", "Y": "-FX-Y"}, 30)
+        4294967294
+
+        :param alphabet: Alphabet used to encode the symbols
+        :param start: Axiome
+        :param replacement: Dictionary which contain replacement values (F->F+F-F-F+F)
+        :param nb_recursive: Number of recursion
+        :type alphabet: Alphabet
+        :type start: str
+        :type replacement: dict
+        :type nb_recursive: int
+
+        :return: Number of symbols
+        :rtype: int"""
+        rules = {alphabet.codes[symbol]: alphabet.encode(value) for symbol, value in replacement.items()}
+        lengths = Lsystem._lengths(alphabet, rules, nb_recursive)[nb_recursive]
+        return sum(lengths[code] for code in alphabet.encode(start))
+
+    @staticmethod
+    def _blocks(rules):
+        """Memoized expansion of a code at a depth
+
+        :param rules: Dictionary which contain encoded replacement values of each code
+        :type rules: dict
+
+        :return: Function returning the expansion of a code at a depth as bytes
+        :rtype: callable"""
+        blocks = {}
+
+        def block(code, depth):
+            expanded = blocks.get((code, depth))
+            if expanded is None:
+                if depth == 0 or code not in rules:
+                    expanded = bytes((code,))
+                else:
+                    expanded = b''.join([block(item, depth - 1) for item in rules[code]])
+                blocks[code, depth] = expanded
+            return expanded
+
+        return block
+
+    @staticmethod
+    def _rotation(divisions=None):
+        """Unit vector of a turn, as a complex number
+
+        >>> Lsystem._rotation(4)(5), abs(Lsystem._rotation()(pi / 2) - 1j) < 1e-15
+        (1j, True)
+
+        :param divisions: Number of divisions of the full turn, None to turn by floating angles
+        :type divisions: int
+
+        :return: Function giving the unit vector of a turn, in divisions of the full turn or in radians
+        :rtype: callable"""
+        if divisions is None:
+            def rotation(turn):
+                return cmath.exp(1j * turn)
+        else:
+            vectors = np.round(np.exp(2j * pi * np.arange(divisions) / divisions), 15).tolist()
+
+            def rotation(turn):
+                return vectors[turn % divisions]
+        return rotation
+
+    @staticmethod
+    def _summary(rule, below, rotation):
+        """Effect on the pen of a rule whose symbols have the summaries below, see _summaries
+
+        :param rule: Codes of the rule
+        :param below: Summaries of the codes one depth below
+        :param rotation: Function giving the unit vector of a turn
+        :type rule: bytes
+        :type below: list
+        :type rotation: callable
+
+        :return: (move, turn, radius) or None
+        :rtype: tuple"""
+        move, turn, radius, saved = 0j, 0, 0.0, []
+        for code in rule:
+            summary = below[code]
+            if summary is None:
+                return None
+            if summary == "save":
+                saved.append((move, turn))
+            elif summary == "restore":
+                if not saved:
+                    return None
+                move, turn = saved.pop()
+            else:
+                radius = max(radius, abs(move) + summary[2])
+                move += summary[0] * rotation(turn)
+                turn += summary[1]
+        return None if saved else (move, turn, radius)
+
+    @staticmethod
+    def _summaries(actions, rules, nb_recursive, divisions=None):
+        """Effect on the pen of the expansion of each code at each depth, for a pen starting at 0 with an angle of 0
+
+        With divisions, turns are counted in divisions of the full turn and moves are summed from the same table of
+        unit vectors than _compile, so the pen lands on the same points.
+
+        >>> actions = [Action("forward", 2, None), Action("turn", pi / 2, None)]
+        >>> Lsystem._summaries(actions, {0: b'\\x00\\x01\\x00'}, 1)[1][0]
+        ((2+2j), 1.5707963267948966, 4.0)
+
+        :param actions: Action of each code
+        :param rules: Dictionary which contain encoded replacement values of each code
+        :param nb_recursive: Number of recursion
+        :param divisions: Number of divisions of the full turn, None to turn by floating angles
+        :type actions: list
+        :type rules: dict
+        :type nb_recursive: int
+        :type divisions: int
+
+        :return: Summaries, indexed by depth then by code: "save" and "restore" for the symbols which save and
+            restore the pen, (move, turn, radius) for the expansions after which the pen stack is as before, with
+            move the displacement as a complex number, turn the angle turned and radius a bound of the distance of
+            the pen to its start, None for the other expansions
+        :rtype: list"""
+        rotation = Lsystem._rotation(divisions)
+        leaves = []
+        for action in actions:
+            kind = getattr(action, "kind", None)
+            if kind == "forward":
+                leaves.append((complex(action.value), 0, abs(action.value)))
+            elif kind == "turn":
+                leaves.append((0j, action.value if divisions is None else round(action.value * divisions / (2 * pi)),
+                               0.0))
+            elif kind == "nothing":
+                leaves.append((0j, 0, 0.0))
+            elif kind in ("save", "restore"):
+                leaves.append(kind)
+            else:
+                leaves.append(None)
+        summaries = [leaves]
+        for depth in range(nb_recursive):
+            below = summaries[-1]
+            summaries.append([Lsystem._summary(rules[code], below, rotation) if code in rules else leaves[code]
+                              for code in range(len(actions))])
+        return summaries
+
+    def _pruned(self, alphabet, start, replacement, constants, nb_recursive, viewport):
+        """Iterate over the expanded L system by chunks of codes, without the subtrees which can not meet a viewport
+
+        The rewrite tree is walked like encoded while the pen is followed from the summaries of the subtrees: a
+        subtree whose disc, centered on the pen with the radius of its summary, does not meet the viewport is not
+        expanded and the pen jumps over it. A jump is given as a tuple (x, y, angle) of the pen after it. The
+        expansion is not pruned when some symbol is not a turn, a forward, a save, a restore or nothing.
+
+        :param alphabet: Alphabet used to encode the symbols
+        :param start: Axiome
+        :param replacement: Dictionary which contain replacement values (F->F+F-F-F+F)
+        :param constants: Dictionary which contain all elements with there function
+        :param nb_recursive: Number of recursion
+        :param viewport: Region (left, top, right, bottom) to draw
+        :type alphabet: Alphabet
+        :type start: str
+        :type replacement: dict
+        :type constants: dict
+        :type nb_recursive: int
+        :type viewport: tuple
+
+        :return: Generator of chunks of codes and of jumps
+        :rtype: generator"""
+        rules = {alphabet.codes[symbol]: alphabet.encode(value) for symbol, value in replacement.items()}
+        actions = [constants.get(symbol) for symbol in alphabet.symbols]
+        divisions = self._divisions([action.value for action in actions if getattr(action, "kind", None) == "turn"])
+        if divisions is not None and abs(round(self.state.angle * divisions / (2 * pi)) * 2 * pi / divisions -
+                                         self.state.angle) > 1e-9:
+            divisions = None
+        summaries = self._summaries(actions, rules, nb_recursive, divisions)
+        if None in summaries[0]:
+            yield from self.encoded(alphabet, start, replacement, nb_recursive, self.chunk_size, self.block_size)
+            return
+        lengths = self._lengths(alphabet, rules, nb_recursive)
+        block = self._blocks(rules)
+        rotation = self._rotation(divisions)
+        unit, full = (1, 2 * pi) if divisions is None else (2 * pi / divisions, divisions)
+        pen, turn, saved = complex(self.state.x, self.state.y), self.state.angle, []
+        if divisions is not None:
+            turn = round(turn / unit) % full
+        jumped = False
+        buffer = bytearray()
+        stack = [(iter(alphabet.encode(start)), nb_recursive)]
+        while stack:
+            codes, depth = stack[-1]
+            for code in codes:
+                summary = summaries[depth][code]
+                if isinstance(summary, tuple) and not self._meets(pen, summary[2], viewport):
+                    if buffer:
+                        yield bytes(buffer)
+                        buffer.clear()
+                    jumped = True
+                    pen += summary[0] * rotation(turn)
+                    turn = (turn + summary[1]) % full
+                    continue
+                if summary is None or lengths[depth][code] > self.block_size:
+                    stack.append((iter(rules[code]), depth - 1))
+                    break
+                if jumped:
+                    yield pen.real, pen.imag, turn * unit
+                    jumped = False
+                buffer += block(code, depth)
+                if len(buffer) >= self.chunk_size:
+                    yield bytes(buffer)
+                    buffer.clear()
+                if summary == "save":
+                    saved.append((pen, turn))
+                elif summary == "restore":
+                    pen, turn = saved.pop()
                 else:
-                    newstart += carac
-            start = newstart
-        for item in start:
-            constants[item]()
+                    pen += summary[0] * rotation(turn)
+                    turn = (turn + summary[1]) % full
+            else:
+                stack.pop()
+        if buffer:
+            yield bytes(buffer)
+        if jumped:
+            yield pen.real, pen.imag, turn * unit
+
+    @staticmethod
+    def encoded(alphabet, start, replacement, nb_recursive, chunk_size=65536, block_size=4096):
+        """Iterate over the expanded L system by chunks of codes, in bounded memory
+
+        The rewrite tree is walked depth-first like expand, but a subtree which expands to at most block_size symbols
+        is emitted at once from a memoized expansion, so the walk only costs Python work for the top of the tree.
+
+        >>> alphabet = Alphabet.of("F", {"F": "F+F"})
+        >>> [alphabet.decode(chunk) for chunk in Lsystem.encoded(alphabet, "F", {"F": "F+F"}, 2)]
+        ['F+F+F+F']
+
+        :param alphabet: Alphabet used to encode the symbols
+        :param start: Axiome
+        :param replacement: Dictionary which contain replacement values (F->F+F-F-F+F)
+        :param nb_recursive: Number of recursion
+        :param chunk_size: Minimal number of codes of each chunk but the last one
+        :param block_size: Maximal length of the memoized expansions
+        :type alphabet: Alphabet
+        :type start: str
+        :type replacement: dict
+        :type nb_recursive: int
+        :type chunk_size: int
+        :type block_size: int
+
+        :return: Generator of chunks of about chunk_size codes
+        :rtype: generator"""
+        rules = {alphabet.codes[symbol]: alphabet.encode(value) for symbol, value in replacement.items()}
+        lengths = Lsystem._lengths(alphabet, rules, nb_recursive)
+        block = Lsystem._blocks(rules)
+        buffer = bytearray()
+        stack = [(iter(alphabet.encode(start)), nb_recursive)]
+        while stack:
+            codes, depth = stack[-1]
+            for code in codes:
+                if lengths[depth][code] <= block_size:
+                    buffer += block(code, depth)
+                    if len(buffer) >= chunk_size:
+                        yield bytes(buffer)
+                        buffer.clear()
+                else:
+                    stack.append((iter(rules[code]), depth - 1))
+                    break
+            else:
+                stack.pop()
+        if buffer:
+            yield bytes(buffer)
+
+    def _compile(self, chunks, constants, alphabet):
+        """Draw chunks of codes by batches of segments
+
+        Actions are dispatched through tables indexed by code. Between two symbols which are not turns, forwards or
+        nothing (save, restore or any callable which is not an Action), the turns and forwards of a chunk make a run,
+        whose positions are computed with a cumulative sum of headings and moves and which is drawn with a single
+        polyline. The other symbols are called as is.
+
+        When every turn is a rational fraction of a full turn, headings are tracked as indexes in a table of unit
+        vectors instead of floating angles. A tuple (x, y, angle) instead of a chunk moves the pen without drawing.
+
+        :param chunks: Chunks of codes to draw, or jumps of the pen
+        :param constants: Dictionary which contain all elements with there function
+        :param alphabet: Alphabet used to encode the symbols
+        :type chunks: iterable
+        :type constants: dict
+        :type alphabet: Alphabet
+        """
+        turns = {item: action.value for item, action in constants.items() if getattr(action, "kind", None) == "turn"}
+        divisions = self._divisions(turns.values())
+        if divisions is None:
+            self.headings = None
+        else:
+            self.headings = np.round(np.exp(2j * pi * np.arange(divisions) / divisions), 15)
+            self._vectors = list(zip(self.headings.real.tolist(), self.headings.imag.tolist()))
+            turns = {item: round(angle * divisions / (2 * pi)) for item, angle in turns.items()}
+        turn_table = np.zeros(len(alphabet), dtype=float if divisions is None else int)
+        step_table = np.zeros(len(alphabet))
+        barrier_table = np.zeros(len(alphabet), dtype=bool)
+        actions = [constants.get(symbol) for symbol in alphabet.symbols]
+        for code, action in enumerate(actions):
+            kind = getattr(action, "kind", None)
+            if kind == "forward":
+                step_table[code] = action.value
+            elif kind == "turn":
+                turn_table[code] = turns[alphabet.symbols[code]]
+            elif kind != "nothing":
+                barrier_table[code] = True
+        turn_list, step_list = turn_table.tolist(), step_table.tolist()
+        for chunk in chunks:
+            if isinstance(chunk, tuple):
+                self.state.x, self.state.y, self.state.angle = chunk
+                continue
+            codes = np.frombuffer(chunk, dtype=np.uint8)
+            if self.stats is not None:
+                self.stats.count("symbols", len(codes))
+            code_list = codes.tolist()
+            start = 0
+            for end in np.flatnonzero(barrier_table[codes]).tolist() + [len(codes)]:
+                if end - start >= self.vector_threshold:
+                    self._draw_run(turn_table[codes[start:end]], step_table[codes[start:end]])
+                elif end > start:
+                    run = code_list[start:end]
+                    self._draw_run([turn_list[code] for code in run], [step_list[code] for code in run])
+                if end < len(code_list):
+                    action = actions[code_list[end]]
+                    if action is None:
+                        raise KeyError(alphabet.symbols[code_list[end]])
+                    action()
+                start = end + 1
+
+    @staticmethod
+    def _divisions(angles, max_divisions=720):
+        """Find the smallest division of the full turn which contains all angles
+
+        >>> Lsystem._divisions([pi / 2, -pi / 2])
+        4
+        >>> Lsystem._divisions([pi * 5 / 36])
+        72
+        >>> Lsystem._divisions([1]) is None
+        True
+
+        :param angles: Angles in radians
+        :param max_divisions: Maximal number of divisions
+        :type angles: iterable
+        :type max_divisions: int
+
+        :return: Number of divisions, None if an angle is not a rational fraction of the full turn
+        :rtype: int"""
+        divisions = 1
+        for angle in angles:
+            fraction = Fraction(angle / (2 * pi)).limit_denominator(max_divisions)
+            if abs(fraction * 2 * pi - angle) > 1e-9:
+                return None
+            divisions = divisions * fraction.denominator // gcd(divisions, fraction.denominator)
+            if divisions > max_divisions:
+                return None
+        return divisions
+
+    def _heading(self):
+        """Index of the pen angle in the heading table
+
+        :return: Index of the angle, None if there is no table or the angle is not in it
+        :rtype: int"""
+        if self.headings is None:
+            return None
+        unit = 2 * pi / len(self.headings)
+        index = round(self.state.angle / unit)
+        if abs(index * unit - self.state.angle) > 1e-9:
+            return None
+        return index % len(self.headings)
+
+    def _draw_short_run(self, turns, steps, heading=None):
+        """Draw a run of turns and forwards which is too short to be worth vectorizing
+
+        :param turns: Angle to turn (to left) for each symbol, or index offset when heading is given
+        :param steps: Distance to forward for each symbol
+        :param heading: Index of the pen angle in the heading table
+        :type turns: list
+        :type steps: list
+        :type heading: int
+        """
+        state = self.state
+        x, y, angle = state.x, state.y, state.angle
+        points = [x, y]
+        if heading is None:
+            for turn, step in zip(turns, steps):
+                angle += turn
+                if step:
+                    x += step * cos(angle)
+                    y += step * sin(angle)
+                    points += (x, y)
+        else:
+            divisions = len(self.headings)
+            vectors = self._vectors
+            for turn, step in zip(turns, steps):
+                heading = (heading + turn) % divisions
+                if step:
+                    vector_x, vector_y = vectors[heading]
+                    x += step * vector_x
+                    y += step * vector_y
+                    points += (x, y)
+            angle = heading * 2 * pi / divisions
+        if len(points) > 2 and not self._outside(points[0::2], points[1::2], state.width):
+            self.line(points, state.color, state.width)
+        state.x, state.y, state.angle = x, y, angle
+
+    def _draw_run(self, turns, steps):
+        """Draw a run of turns and forwards with a single polyline
+
+        :param turns: Angle to turn (to left) for each symbol, or index offset in the heading table
+        :param steps: Distance to forward for each symbol
+        :type turns: list or numpy.ndarray
+        :type steps: list or numpy.ndarray
+        """
+        with stage(self.stats, "geometry"):
+            heading = self._heading()
+            if heading is None and self.headings is not None:
+                turns = [turn * 2 * pi / len(self.headings) for turn in turns]
+            if len(steps) < self.vector_threshold:
+                self._draw_short_run(turns, steps, heading)
+                return
+            if heading is None:
+                headings = np.cumsum(np.concatenate(([self.state.angle], turns)))[1:]
+                vectors = np.exp(1j * headings)
+                angle = float(headings[-1])
+            else:
+                headings = np.cumsum(np.concatenate(([heading], turns)))[1:] % len(self.headings)
+                vectors = self.headings[headings]
+                angle = int(headings[-1]) * 2 * pi / len(self.headings)
+            steps = np.asarray(steps, dtype=float)
+            positions = np.cumsum(np.concatenate(([complex(self.state.x, self.state.y)], steps * vectors)))
+            points = positions[np.concatenate(([True], steps != 0))]
+            if len(points) > 1:
+                self._polyline(points, self.state.color, self.state.width)
+            self.state.angle = angle
+            self.state.x, self.state.y = float(positions[-1].real), float(positions[-1].imag)
+
+    @staticmethod
+    def expand(start, replacement, nb_recursive):
+        """Iterate over the symbols of a L system without building the rewritten string
+
+        The rewrite tree is walked depth-first, so only one iterator per level of recursion is kept in memory and
+        the first symbols are available before the whole expansion is done.
+
+        >>> ''.join(Lsystem.expand("F", {"F": "F+F"}, 2))
+        'F+F+F+F'
+        >>> ''.join(Lsystem.expand("FX", {"X": "X+YF+", "Y": "-FX-Y"}, 0))
+        'FX'
+
+        :param start: Axiome
+        :param replacement: Dictionary which contain replacement values (F->F+F-F-F+F)
+        :param nb_recursive: Number of recursion
+        :type start: str
+        :type replacement: dict
+        :type nb_recursive: int
+
+        :return: Generator of the symbols of the expanded L system
+        :rtype: generator"""
+        stack = [iter(start)]
+        while stack:
+            for item in stack[-1]:
+                if len(stack) <= nb_recursive and item in replacement:
+                    stack.append(iter(replacement[item]))
+                    break
+                yield item
+            else:
+                stack.pop()
 
     def right(self, angle):
-        """Return a lambda function which make pen turning of angle radians to right
+        """Return an action which make pen turning of angle radians to right
 
         :param angle: Angle to build function
         :type angle: float
 
-        :return: lambda function to make pen turning right
-        :rtype: lambda"""
-        return lambda: self._right(angle)
+        :return: action to make pen turning right
+        :rtype: Action"""
+        return Action("turn", -angle, lambda: self._right(angle))
 
     def left(self, angle):
-        """Return a lambda function which make pen turning of angle radians to left
+        """Return an action which make pen turning of angle radians to left
 
         :param angle: Angle to build function
         :type angle: float
 
-        :return: lambda function to make pen turning left
-        :rtype: lambda"""
-        return lambda: self._left(angle)
+        :return: action to make pen turning left
+        :rtype: Action"""
+        return Action("turn", angle, lambda: self._left(angle))
 
     def forward(self, distance):
-        """Return a lambda function which make pen forward of distance
+        """Return an action which make pen forward of distance
 
         :param distance: Distance to build function
         :type distance: float
 
-        :return: lambda function to make pen forward
-        :rtype: lambda"""
-        return lambda: self._forward(distance)
+        :return: action to make pen forward
+        :rtype: Action"""
+        return Action("forward", distance, lambda: self._forward(distance))
 
     def backward(self, distance):
-        """Return a lambda function which make pen backward of distance
+        """Return an action which make pen backward of distance
 
         :param distance: Distance to build function
         :type distance: float
 
-        :return: lambda function to make pen backward
-        :rtype: lambda"""
-        return lambda: self._backward(distance)
+        :return: action to make pen backward
+        :rtype: Action"""
+        return Action("forward", -distance, lambda: self._backward(distance))
 
     def save(self):
-        """Return a lambda function which save state of pen
+        """Return an action which save state of pen
 
-        :return: lambda function to save pen state
-        :rtype: lambda"""
-        return lambda: self._save()
+        :return: action to save pen state
+        :rtype: Action"""
+        return Action("save", None, lambda: self._save())
 
     def restore(self):
-        """Return a lambda function which restore state of pen
+        """Return an action which restore state of pen
 
-        :return: lambda function to restore pen state
-        :rtype: lambda"""
-        return lambda: self._restore()
+        :return: action to restore pen state
+        :rtype: Action"""
+        return Action("restore", None, lambda: self._restore())
 
     def nothing(self):
-        return lambda: None
+        """Return an action which does nothing
+
+        :return: action which does nothing
+        :rtype: Action"""
+        return Action("nothing", None, lambda: None)
+
+
+class Affine:
+    """Affine transform of the plane
 
+    Transforms are composed with @ (the right one is applied first), so a chain of transforms is applied to the
+    points with a single matrix application.
 
-class Figures(ImageDraw.ImageDraw):
-    """A lot of function to create some well-know shapes"""
+    >>> (Affine.translation((1, 0)) @ Affine.homothety(2))(1j)
+    (1.0, 2.0)
+    >>> transform = Affine.translation((1, 0)) @ Affine.homothety(2) @ Affine.rotation(pi / 2)
+    >>> transform(np.array([1, 1j])).round(12)
+    array([ 1.+2.j, -1.+0.j])
+    >>> transform(array('d', [1, 0, 0, 1])).round(12)
+    array([ 1.,  2., -1.,  0.])"""
+    __slots__ = ("matrix",)
+    matrix: np.ndarray
+
+    def __init__(self, matrix=None):
+        """Initialisation of transform
+
+        :param matrix: Matrix 3x3 of the transform in homogeneous coordinates, identity if None
+        :type matrix: numpy.ndarray"""
+        self.matrix = np.identity(3) if matrix is None else np.asarray(matrix, dtype=float)
+
+    @staticmethod
+    def _complex(point):
+        """Transform tuple or complex to complex
+
+        :param point: Point to convert
+        :type point: tuple or complex
+
+        :return: Complex representation of point
+        :rtype: complex"""
+        if isinstance(point, complex):
+            return point
+        return complex(point[0], point[1])
+
+    @classmethod
+    def similarity(cls, factor, offset=0j):
+        """Transform z -> factor * z + offset
+
+        :param factor: Complex factor (rotation and homothety)
+        :param offset: Translation applied after the factor
+        :type factor: complex
+        :type offset: complex
+
+        :return: The transform
+        :rtype: Affine"""
+        return cls([[factor.real, -factor.imag, offset.real],
+                    [factor.imag, factor.real, offset.imag],
+                    [0, 0, 1]])
+
+    @classmethod
+    def rotation(cls, angle, center=0j):
+        """Rotation of angle radians around center
+
+        :param angle: angle of rotation
+        :param center: center of rotation
+        :type angle: float
+        :type center: tuple or complex
+
+        :return: The transform
+        :rtype: Affine"""
+        center = cls._complex(center)
+        factor = cmath.exp(1j * angle)
+        return cls.similarity(factor, center - factor * center)
+
+    @classmethod
+    def homothety(cls, size, center=0j):
+        """Homothety of factor size around center
+
+        :param size: size of homothety
+        :param center: center of homothety
+        :type size: float
+        :type center: tuple or complex
+
+        :return: The transform
+        :rtype: Affine"""
+        center = cls._complex(center)
+        return cls.similarity(complex(size), center - size * center)
+
+    @classmethod
+    def translation(cls, vect):
+        """Translation of vector vect
+
+        :param vect: vector of translation
+        :type vect: tuple or complex
+
+        :return: The transform
+        :rtype: Affine"""
+        return cls.similarity(1 + 0j, cls._complex(vect))
+
+    def __matmul__(self, other):
+        return Affine(self.matrix @ other.matrix)
+
+    def __call__(self, points):
+        """Apply the transform on points
+
+        Complex arrays give complex arrays, float arrays and buffers of interleaved x/y give float arrays of the same
+        shape, lists give lists of tuples and single points give a tuple. Typed buffers are read with their own element
+        type, untyped ones (bytes, bytearray, mmap) as packed float64.
+
+        >>> Affine.translation((1, 0))(array('f', [1, 0, 0, 1]))
+        array([2., 0., 1., 1.])
+        >>> Affine.translation((1, 0))(np.array([1, 2, 3, 4], dtype=np.float64).tobytes())
+        array([2., 2., 4., 4.])
+
+        :param points: Points to transform
+        :type points: numpy.ndarray, buffer, list, tuple or complex
+
+        :return: Transformed points
+        :rtype: numpy.ndarray, list or tuple"""
+        if isinstance(points, np.ndarray):
+            if points.dtype.kind == 'c':
+                return self._apply(points)
+            return self._apply_interleaved(points)
+        if isinstance(points, list):
+            transformed = self._apply(np.asarray([self._complex(point) for point in points], dtype=complex))
+            return list(zip(transformed.real.tolist(), transformed.imag.tolist()))
+        if isinstance(points, (tuple, complex)):
+            transformed = self._apply(np.array([self._complex(points)]))[0]
+            return float(transformed.real), float(transformed.imag)
+        view = memoryview(points)
+        if view.format in ('B', 'b', 'c'):
+            return self._apply_interleaved(np.frombuffer(points, dtype=np.float64))
+        return self._apply_interleaved(np.asarray(view, dtype=float))
+
+    def _apply(self, points):
+        """Apply the transform on an array of complex points
+
+        :param points: Points to transform
+        :type points: numpy.ndarray
+
+        :return: Transformed points
+        :rtype: numpy.ndarray"""
+        (a, b, c), (d, e, f) = self.matrix[:2].tolist()
+        x, y = points.real, points.imag
+        transformed = np.empty(points.shape, dtype=complex)
+        transformed.real = a * x + b * y + c
+        transformed.imag = d * x + e * y + f
+        return transformed
+
+    def _apply_interleaved(self, points):
+        """Apply the transform on an array of interleaved x/y coordinates
+
+        :param points: Coordinates to transform
+        :type points: numpy.ndarray
+
+        :return: Transformed coordinates, with the same shape
+        :rtype: numpy.ndarray"""
+        coordinates = np.asarray(points, dtype=float).reshape(-1, 2)
+        return (coordinates @ self.matrix[:2, :2].T + self.matrix[:2, 2]).reshape(np.shape(points))
+
+
+class Figures(Canvas):
+    """A lot of function to create some well-know shapes
+
+    The von koch curves stop dividing their segments once they are shorter than detail pixels, so iterations beyond
+    the resolution of the image cost nothing, 0 divides them as many times as asked."""
+    detail: float = 1
 
     @staticmethod
     def point_to_complex(point):
@@ -341,60 +1765,42 @@ class Figures(ImageDraw.ImageDraw):
     def rotation(self, point, center=0j, angle=0):
         """Rotate point in complex plane
 
-        :param point: point (or list of point) to rotate
+        :param point: point (or list of point, array of complex, buffer of interleaved x/y) to rotate
         :type point: tuple or complex
         :param center: center of rotation
         :type center: tuple or complex
         :param angle: angle of rotation
         :type angle: float
 
-        :return: Rotated point (or list of rotated points)
+        :return: Rotated point (or list of rotated points, array of rotated points)
         :rtype: tuple or list of tuples"""
-        if type(center) != complex:
-            center = self.point_to_complex(center)
-        if type(point) == list:
-            return [self.rotation(p, center, angle) for p in point]
-        if type(point) != complex:
-            point = self.point_to_complex(point)
-        return self.complex_to_point(cmath.exp(complex(0, 1) * angle) * (point - center) + center)
+        return Affine.rotation(angle, center)(point)
 
     def homothety(self, point, center=0j, size=0):
         """Homothety of point in complex plane
 
-        :param point: point (or list of point) to make homothety
+        :param point: point (or list of point, array of complex, buffer of interleaved x/y) to make homothety
         :type point: tuple or complex
         :param center: center of homothety
         :type center: tuple or complex
         :param size: size of homothety
         :type size: float
 
-        :return: Homothety of point (or list of homothety of points)
+        :return: Homothety of point (or list of homothety of points, array of homothety of points)
         :rtype: tuple or list of tuples"""
-        if type(center) != complex:
-            center = self.point_to_complex(center)
-        if type(point) == list:
-            return [self.homothety(p, center, size) for p in point]
-        if type(point) != complex:
-            point = self.point_to_complex(point)
-        return self.complex_to_point(size * (point - center) + center)
+        return Affine.homothety(size, center)(point)
 
     def translation(self, point, vect):
         """Translate point in complex plane
 
-        :param point: point (or list of point) to translate
+        :param point: point (or list of point, array of complex, buffer of interleaved x/y) to translate
         :type point: tuple or complex
         :param vect: vector of translation
         :type vect: tuple or complex
 
-        :return: Translated point (or list of translated points)
+        :return: Translated point (or list of translated points, array of translated points)
         :rtype: tuple or list of tuples"""
-        if type(vect) != complex:
-            vect = self.point_to_complex(vect)
-        if type(point) == list:
-            return [self.translation(p, vect) for p in point]
-        if type(point) != complex:
-            point = self.point_to_complex(point)
-        return self.complex_to_point(point + vect)
+        return Affine.translation(vect)(point)
 
     def blanc_manger(self, origin, finish, iterations, color=None, width=0):
         """Trace blanc manger curve
@@ -409,30 +1815,36 @@ class Figures(ImageDraw.ImageDraw):
         :type iterations: int
         :type color: tuple
         :type width: int"""
-        lenght_theoric = 2 ** iterations
-        length = (((origin[0] - finish[0]) ** 2 + (origin[1] - finish[1]) ** 2) ** 0.5)
+        with stage(self.stats, "geometry"):
+            self._polyline(self.blanc_manger_points(origin, finish, iterations), color, width)
+        self._report()
 
-        def sawtooth(x):
-            d = x - int(x)
-            if d <= 1 / 2:
-                return d
-            return 1 - d
+    @staticmethod
+    def blanc_manger_points(origin, finish, iterations):
+        """Compute the points of the blanc manger curve
 
-        def blanc_manger(x, iterations=1):
-            return sum([1 / (2 ** k) * sawtooth((2 ** k) * x) for k in range(iterations)])
+        The 2 ** iterations + 1 points are computed at once on arrays, then rotated and translated on the segment
+        from origin to finish with a single complex multiply-add.
 
-        points = [
-            ((i / lenght_theoric) * length,
-             (blanc_manger(i / lenght_theoric, iterations)) * length)
-            for i in range(lenght_theoric + 1)]
+        >>> Figures.blanc_manger_points((0, 0), (4, 0), 2)
+        array([0.+0.j, 1.+2.j, 2.+2.j, 3.+2.j, 4.+0.j])
 
-        if finish[0] == origin[0]:
-            angle = pi/2
-        else:
-            angle = atan((finish[1] - origin[1]) / (finish[0] - origin[0]))
-        points = self.rotation(points, (0, 0), angle)
-        points = self.translation(points, origin)
-        self.line(points, color, width)
+        :param origin: coordinate of the starting point
+        :param finish: coordinate of the ending point
+        :param iterations: iterations for the drawings
+        :type origin: tuple
+        :type finish: tuple
+        :type iterations: int
+
+        :return: Points of the curve as complex numbers
+        :rtype: numpy.ndarray"""
+        abscissa = np.arange(2 ** iterations + 1) / 2 ** iterations
+        ordinate = np.zeros_like(abscissa)
+        for k in range(iterations):
+            scaled = abscissa * 2 ** k
+            ordinate += np.abs(scaled - np.round(scaled)) / 2 ** k
+        origin = complex(*origin)
+        return (abscissa + 1j * ordinate) * (complex(*finish) - origin) + origin
 
     def von_koch_curve_flake(self, origin, radius, iterations, angle=0, color=None, width=0):
         """Draw the von koch flake on image.
@@ -453,20 +1865,102 @@ class Figures(ImageDraw.ImageDraw):
         summit_1 = (origin[0] + cos(angle) * radius, origin[1] + sin(angle) * radius)
         summit_2 = (origin[0] + cos(angle + 2 / 3 * pi) * radius, origin[1] + sin(angle + 2 / 3 * pi) * radius)
         summit_3 = (origin[0] + cos(angle - 2 / 3 * pi) * radius, origin[1] + sin(angle - 2 / 3 * pi) * radius)
-        self.von_koch_curve(summit_2, summit_1, iterations, color, width)
-        self.von_koch_curve(summit_3, summit_2, iterations, color, width)
-        self.von_koch_curve(summit_1, summit_3, iterations, color, width)
+        with stage(self.stats, "geometry"):
+            if self.viewport is not None:
+                viewport = self._grown(self.viewport, width)
+                sides = [self.von_koch_segments(first, last, iterations, viewport, self.detail)
+                         for first, last in ((summit_2, summit_1), (summit_1, summit_3), (summit_3, summit_2))]
+                self._polylines(np.concatenate([starts for starts, _ in sides]),
+                                np.concatenate([ends for _, ends in sides]), color, width)
+            else:
+                points = np.concatenate((self.von_koch_points(summit_2, summit_1, iterations, self.detail),
+                                         self.von_koch_points(summit_1, summit_3, iterations, self.detail)[1:],
+                                         self.von_koch_points(summit_3, summit_2, iterations, self.detail)[1:]))
+                self._polyline(points, color, width)
+        self._report()
+
+    @staticmethod
+    def von_koch_points(origin, finish, iterations=1, detail=0):
+        """Compute the points of the von koch curve
+
+        Each iteration replaces every segment of the curve by four segments at once on the whole array of points.
+
+        >>> Figures.von_koch_points((0, 0), (3, 0)).round(3)
+        array([0. +0.j   , 1. +0.j   , 1.5+0.866j, 2. +0.j   , 3. +0.j   ])
+        >>> len(Figures.von_koch_points((0, 0), (3, 0), 4))
+        257
+        >>> len(Figures.von_koch_points((0, 0), (81, 0), 30, detail=1))
+        1025
+
+        :param origin: coordinate of the starting point
+        :param finish: coordinate of the ending point
+        :param iterations: iterations for the drawings
+        :param detail: Length under which segments are not divided anymore, in pixels
+        :type origin: tuple
+        :type finish: tuple
+        :type iterations: int
+        :type detail: float
+
+        :return: Points of the curve as complex numbers
+        :rtype: numpy.ndarray"""
+        points = np.array([complex(*origin), complex(*finish)])
+        summit = cmath.exp(1j * pi / 3)
+        for _ in range(max(iterations, 1)):
+            if abs(points[1] - points[0]) < detail:
+                break
+            start = points[:-1]
+            third = (points[1:] - start) / 3
+            new_points = np.empty(4 * len(start) + 1, dtype=complex)
+            new_points[0:-1:4] = start
+            new_points[1::4] = start + third
+            new_points[2::4] = start + third + third * summit
+            new_points[3::4] = start + 2 * third
+            new_points[-1] = points[-1]
+            points = new_points
+        return points
 
     @staticmethod
-    def _int(value):
-        """Make a tuple of float coordinate into tuple of int coordinate
+    def von_koch_segments(origin, finish, iterations=1, viewport=None, detail=0):
+        """Compute the segments of the von koch curve which may meet a viewport
 
-        :param value: Tuple to convert
-        :type value: tuple
+        A von koch curve lies in the disc whose diameter is its base, so at each iteration the segments whose disc
+        does not meet the viewport are dropped instead of being divided: the cost follows the visible detail. The
+        points are computed like von_koch_points.
 
-        :return: new tuple with int values
-        :rtype: tuple(int, int)"""
-        return int(value[0]), int(value[1])
+        >>> starts, ends = Figures.von_koch_segments((0, 0), (3 ** 10, 0), 10, (0, 0, 10, 10))
+        >>> len(starts), len(Figures.von_koch_points((0, 0), (3 ** 10, 0), 10)) - 1
+        (28, 1048576)
+
+        :param origin: coordinate of the starting point
+        :param finish: coordinate of the ending point
+        :param iterations: iterations for the drawings
+        :param viewport: Region (left, top, right, bottom) to keep, the whole curve if None
+        :param detail: Length under which segments are not divided anymore, in pixels
+        :type origin: tuple
+        :type finish: tuple
+        :type iterations: int
+        :type viewport: tuple
+        :type detail: float
+
+        :return: First and last points of the segments as complex numbers
+        :rtype: tuple"""
+        starts, ends = np.array([complex(*origin)]), np.array([complex(*finish)])
+        summit = cmath.exp(1j * pi / 3)
+        for _ in range(max(iterations, 1)):
+            if len(starts) and abs(ends[0] - starts[0]) < detail:
+                break
+            if viewport is not None:
+                kept = Canvas._meets((starts + ends) / 2, np.abs(ends - starts) / 2, viewport)
+                starts, ends = starts[kept], ends[kept]
+            third = (ends - starts) / 3
+            points = np.empty((len(starts), 5), dtype=complex)
+            points[:, 0] = starts
+            points[:, 1] = starts + third
+            points[:, 2] = starts + third + third * summit
+            points[:, 3] = starts + 2 * third
+            points[:, 4] = ends
+            starts, ends = points[:, :4].ravel(), points[:, 1:].ravel()
+        return starts, ends
 
     def von_koch_curve(self, origin, finish, iterations=1, color=None, width=0):
         """Draw the von koch curve on image.
@@ -481,26 +1975,14 @@ class Figures(ImageDraw.ImageDraw):
         :type iterations: int
         :type color: tuple
         :type width: int"""
-        third = origin[0] + (finish[0] - origin[0]) * 1 / 3, origin[1] + (finish[1] - origin[1]) * 1 / 3
-        two_third = origin[0] + (finish[0] - origin[0]) * 2 / 3, origin[1] + (finish[1] - origin[1]) * 2 / 3
-
-        length = (((origin[0] - finish[0]) ** 2 + (origin[1] - finish[1]) ** 2) ** 0.5) / 3
-        if finish[0] == origin[0]:
-            angle = pi/2
-        else:
-            angle = atan((finish[1] - origin[1]) / (finish[0] - origin[0]))
-        angle_total = angle + pi / 3
-        if origin[0] > finish[0]:
-            angle_total += pi
-        summit = (cos(angle_total) * length + third[0], sin(angle_total) * length + third[1])
-        if iterations <= 1:
-            self.line([self._int(origin), self._int(third), self._int(summit), self._int(two_third), self._int(finish)],
-                      color, width)
-        else:
-            self.von_koch_curve(self._int(origin), self._int(third), iterations - 1, color, width)
-            self.von_koch_curve(self._int(third), self._int(summit), iterations - 1, color, width)
-            self.von_koch_curve(self._int(summit), self._int(two_third), iterations - 1, color, width)
-            self.von_koch_curve(self._int(two_third), self._int(finish), iterations - 1, color, width)
+        with stage(self.stats, "geometry"):
+            if self.viewport is not None:
+                starts, ends = self.von_koch_segments(origin, finish, iterations, self._grown(self.viewport, width),
+                                                      self.detail)
+                self._polylines(starts, ends, color, width)
+            else:
+                self._polyline(self.von_koch_points(origin, finish, iterations, self.detail), color, width)
+        self._report()
 
 
 if __name__ == "__main__":
@@ -509,4 +1991,4 @@ if __name__ == "__main__":
     figures.blanc_manger((2000, 2000), (3000, 3000), 7, color=(0, 0, 0), width=2)"""
     figures = Figures(im=img)
     figures.blanc_manger((1000, 2500), (4000, 2500), 5, color=(0, 0, 0), width=3)
-    img.save("D:\\Users\\louis chauvet\\Documents\\GitHub\\fractale\\test.bmp")
+    img.save("test.bmp")
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""
+Opt-in instrumentation of the renders.
+
+>>> stats = Stats()
+>>> with stats.stage("geometry"):
+...     stats.count("segments", 3)
+>>> stats.counters["segments"]
+3
+>>> sorted(stats.timings)
+['geometry']
+"""
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def touched_pixels(points, width=1):
+    """Estimate the number of pixels touched by a polyline
+
+    >>> touched_pixels([(0, 0), (10, 3), (10, 5)])
+    14
+
+    :param points: Points of the polyline, as pairs or as a flat list of coordinates
+    :param width: Width of the line, in pixels
+    :type points: list
+    :type width: int
+
+    :return: Number of pixels
+    :rtype: int"""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return segment_pixels(np.column_stack((points[:-1], points[1:])), width)
+
+
+def segment_pixels(segments, width=1):
+    """Estimate the number of pixels touched by segments
+
+    >>> segment_pixels([(0, 0, 10, 3), (20, 20, 20, 22)])
+    14
+
+    :param segments: Segments (x0, y0, x1, y1)
+    :param width: Width of the segments, in pixels
+    :type segments: list
+    :type width: int
+
+    :return: Number of pixels
+    :rtype: int"""
+    segments = np.asarray(segments, dtype=float).reshape(-1, 4)
+    lengths = np.abs(segments[:, 2:] - segments[:, :2]).max(axis=1) + 1
+    return int(lengths.sum()) * max(width or 1, 1)
+
+
+class _NoStage:
+    """Context manager which does nothing, used when stats are disabled"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(stats, name):
+    """Time a block as the stage name if stats are enabled
+
+    :param stats: Stats to update, or None when disabled
+    :param name: Name of the stage
+    :type stats: Stats
+    :type name: str
+
+    :return: Context manager timing the block
+    :rtype: contextmanager"""
+    if stats is None:
+        return _NO_STAGE
+    return stats.stage(name)
+
+
+class Stats:
+    """Timings and counters of the stages of renders
+
+    Stages are timed exclusively: time spent in a nested stage is not counted in the enclosing one. Usual stages are
+    "expansion", "geometry", "rasterization" and "encode", usual counters are "symbols", "segments", "pushes",
+    "pops" and "pixels".
+
+    :param callback: Function called with the stats after each render
+    :type callback: callable"""
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+        self._stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time the block as the stage name
+
+        :param name: Name of the stage
+        :type name: str"""
+        now = time.perf_counter()
+        if self._stages:
+            self.timings[self._stages[-1][0]] += now - self._stages[-1][1]
+        self._stages.append([name, now])
+        try:
+            yield self
+        finally:
+            now = time.perf_counter()
+            self.timings[name] += now - self._stages.pop()[1]
+            if self._stages:
+                self._stages[-1][1] = now
+
+    def count(self, name, value=1):
+        """Add value to the counter name
+
+        :param name: Name of the counter
+        :param value: Value to add
+        :type name: str
+        :type value: int"""
+        self.counters[name] += value
+
+    def report(self):
+        """Give the stats to the callback, called at the end of each render"""
+        if self.callback is not None:
+            self.callback(self)
+
+    def reset(self):
+        """Clear all timings and counters"""
+        self.timings.clear()
+        self.counters.clear()
+
+    def as_dict(self):
+        """Timings and counters as plain dictionaries
+
+        :return: Dictionary with "timings" and "counters"
+        :rtype: dict"""
+        return {"timings": dict(self.timings), "counters": dict(self.counters)}
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tile pyramid of a fractal, written as z/x/y images for deep-zoom viewers.
+
+A spec is the one of batch.py without output: the generator, its arguments and the size of the full resolution image,
+whose coordinates the arguments use. The deepest level has a pixel of the tiles for a pixel of the full image, each
+level above halves the resolution, up to level 0 where the whole image fits in a tile:
+
+    {"generator": "Lsystem.dragon", "args": [1, 24], "kwargs": {"color": [255, 255, 255], "width": 1},
+     "size": [16384, 16384], "position": [11000, 6000]}
+
+Each tile is drawn on its own with a backends.TransformBackend, only from the geometry which can meet it (see
+main.Canvas) and with the recursive figures divided down to a pixel of its level, so the memory of a worker is bounded
+by the size of a tile and a tile costs about the detail it shows. Tiles are written in a temporary file then renamed,
+so an interrupted pyramid only holds whole tiles, and the tiles which already exist are skipped: running the command
+again resumes the pyramid.
+
+    python tiles.py spec.json pyramid --tile-size 256 --workers 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from PIL import Image
+
+from backends import PilBackend, TransformBackend
+from batch import _tuples
+from cache import background_of, draw
+
+
+def max_zoom(size, tile_size=256):
+    """Deepest level of a pyramid, the first one where a pixel of the tiles is a pixel of the image
+
+    >>> max_zoom((1000, 600)), max_zoom((256, 256))
+    (2, 0)
+
+    :param size: Size of the full resolution image
+    :param tile_size: Size of the side of a tile, in pixels
+    :type size: tuple
+    :type tile_size: int
+
+    :return: The deepest level
+    :rtype: int"""
+    zoom = 0
+    while tile_size << zoom < max(size):
+        zoom += 1
+    return zoom
+
+
+def tile_count(size, zoom, deepest, tile_size=256):
+    """Number of columns and rows of tiles of a level
+
+    >>> tile_count((1000, 600), 2, 2), tile_count((1000, 600), 1, 2)
+    ((4, 3), (2, 2))
+
+    :param size: Size of the full resolution image
+    :param zoom: Level
+    :param deepest: Deepest level of the pyramid
+    :param tile_size: Size of the side of a tile, in pixels
+    :type size: tuple
+    :type zoom: int
+    :type deepest: int
+    :type tile_size: int
+
+    :return: Columns and rows
+    :rtype: tuple"""
+    span = tile_size << (deepest - zoom)
+    return -(-size[0] // span), -(-size[1] // span)
+
+
+def tiles(size, deepest, tile_size=256):
+    """Iterate over the tiles of a pyramid, level by level from the top
+
+    >>> list(tiles((300, 200), 1))
+    [(0, 0, 0), (1, 0, 0), (1, 1, 0)]
+
+    :param size: Size of the full resolution image
+    :param deepest: Deepest level of the pyramid
+    :param tile_size: Size of the side of a tile, in pixels
+    :type size: tuple
+    :type deepest: int
+    :type tile_size: int
+
+    :return: Generator of (zoom, x, y)
+    :rtype: generator"""
+    for zoom in range(deepest + 1):
+        columns, rows = tile_count(size, zoom, deepest, tile_size)
+        for x in range(columns):
+            for y in range(rows):
+                yield zoom, x, y
+
+
+def tile_path(directory, zoom, x, y, format="PNG"):
+    """Path of a tile, directory/zoom/x/y.extension
+
+    >>> tile_path("pyramid", 3, 1, 2).split(os.sep)
+    ['pyramid', '3', '1', '2.png']"""
+    return os.path.join(directory, str(zoom), str(x), "{}.{}".format(y, format.lower()))
+
+
+def render_tile(spec, zoom, x, y, deepest, tile_size=256, detail=1):
+    """Draw a tile of the pyramid of a spec
+
+    >>> spec = {"generator": "Figures.von_koch_curve", "args": ((0, 300), (1000, 300), 6),
+    ...         "kwargs": {"color": 255, "width": 1}, "size": (1000, 600), "mode": "L"}
+    >>> render_tile(spec, 2, 1, 1, 2).getbbox()
+    (0, 44, 195, 256)
+
+    :param spec: Spec of the pyramid
+    :param zoom: Level of the tile
+    :param x: Column of the tile
+    :param y: Row of the tile
+    :param deepest: Deepest level of the pyramid
+    :param tile_size: Size of the side of a tile, in pixels
+    :param detail: Size under which the recursive figures are not divided anymore, in pixels of the tile
+    :type spec: dict
+    :type zoom: int
+    :type x: int
+    :type y: int
+    :type deepest: int
+    :type tile_size: int
+    :type detail: float
+
+    :return: The tile
+    :rtype: Image.Image"""
+    spec = _tuples(spec)
+    mode, background = spec.get("mode", "RGB"), background_of(spec["generator"], spec.get("background"))
+    image = Image.new(mode, (tile_size, tile_size), background)
+    scale = 0.5 ** (deepest - zoom)
+    margin = ((spec.get("kwargs") or {}).get("width") or 1) + 1
+    viewport = ((x * tile_size - margin) / scale, (y * tile_size - margin) / scale,
+                ((x + 1) * tile_size + margin) / scale, ((y + 1) * tile_size + margin) / scale)
+    backend = TransformBackend(PilBackend(image), scale, (-x * tile_size, -y * tile_size), snap=True)
+    draw(spec["generator"], spec.get("args", ()), spec.get("kwargs"), spec.get("size", (1000, 1000)), mode,
+         background, spec.get("position"), image=backend, viewport=viewport, detail=detail / scale)
+    return image
+
+
+def write_tile(image, path, format="PNG"):
+    """Write a tile in a temporary file renamed to path, so path is never a partial tile
+
+    :param image: The tile
+    :param path: Path of the tile
+    :param format: Format of the tile
+    :type image: Image.Image
+    :type path: str
+    :type format: str"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(descriptor, "wb") as tile:
+            image.save(tile, format)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def run_tile(spec, zoom, x, y, deepest, path, tile_size=256, detail=1, format="PNG"):
+    """Draw and write a tile and report it, errors are reported instead of raised
+
+    Parameters are the ones of render_tile and write_tile.
+
+    :return: Report with the tile (zoom/x/y), the status ("ok" or "failed"), the wall time and the error
+    :rtype: dict"""
+    start = time.perf_counter()
+    report = {"tile": "{}/{}/{}".format(zoom, x, y), "status": "ok"}
+    try:
+        write_tile(render_tile(spec, zoom, x, y, deepest, tile_size, detail), path, format)
+    except Exception:
+        report.update(status="failed", error=traceback.format_exc(limit=-3))
+    report["wall_time"] = time.perf_counter() - start
+    return report
+
+
+def run(spec, directory, tile_size=256, deepest=None, workers=None, detail=1, format="PNG"):
+    """Write the pyramid of a spec, tiles which already exist are skipped
+
+    :param spec: Spec of the pyramid
+    :param directory: Directory of the pyramid
+    :param tile_size: Size of the side of a tile, in pixels
+    :param deepest: Deepest level, the level of the full resolution if None
+    :param workers: Number of processes, defaults to the number of CPUs, 1 to render in the current process
+    :param detail: Size under which the recursive figures are not divided anymore, in pixels of the tiles
+    :param format: Format of the tiles
+    :type spec: dict
+    :type directory: str
+    :type tile_size: int
+    :type deepest: int
+    :type workers: int
+    :type detail: float
+    :type format: str
+
+    :return: Generator of the reports of the tiles, in order of completion, with a status "skipped" for existing tiles
+    :rtype: generator"""
+    size = tuple(spec.get("size", (1000, 1000)))
+    if deepest is None:
+        deepest = max_zoom(size, tile_size)
+    jobs = ((zoom, x, y, tile_path(directory, zoom, x, y, format)) for zoom, x, y in tiles(size, deepest, tile_size))
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for zoom, x, y, path in jobs:
+            if os.path.exists(path):
+                yield {"tile": "{}/{}/{}".format(zoom, x, y), "status": "skipped", "wall_time": 0.0}
+            else:
+                yield run_tile(spec, zoom, x, y, deepest, path, tile_size, detail, format)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for zoom, x, y, path in jobs:
+            if os.path.exists(path):
+                yield {"tile": "{}/{}/{}".format(zoom, x, y), "status": "skipped", "wall_time": 0.0}
+                continue
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(run_tile, spec, zoom, x, y, deepest, path, tile_size, detail, format))
+        for future in wait(pending).done:
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the tile pyramid of a fractal")
+    parser.add_argument("spec", help="JSON file of the spec of the fractal")
+    parser.add_argument("directory", help="Directory of the pyramid, tiles already in it are kept")
+    parser.add_argument("--tile-size", type=int, default=256, help="Size of the side of a tile, in pixels")
+    parser.add_argument("--max-zoom", type=int, default=None, help="Deepest level, full resolution by default")
+    parser.add_argument("--workers", type=int, default=None, help="Number of processes, defaults to the CPUs")
+    parser.add_argument("--detail", type=float, default=1, help="Size of the smallest detail drawn, in pixels")
+    parser.add_argument("--format", default="PNG", help="Format of the tiles")
+    arguments = parser.parse_args(argv)
+    with open(arguments.spec) as file:
+        spec = json.load(file)
+    counts = {"ok": 0, "skipped": 0, "failed": 0}
+    start = time.perf_counter()
+    for report in run(spec, arguments.directory, arguments.tile_size, arguments.max_zoom, arguments.workers,
+                      arguments.detail, arguments.format):
+        counts[report["status"]] += 1
+        if report["status"] == "failed":
+            print("failed {tile}".format(**report), file=sys.stderr)
+            print(report["error"], file=sys.stderr)
+    print("{ok} written, {skipped} skipped, {failed} failed, {:.3f}s".format(time.perf_counter() - start, **counts))
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+Vector images, streamed to an SVG or PDF file as lines are drawn.
+
+A vector image takes the place of a pillow image: Lsystem, Figures and betterTurtle.Turtle draw their lines on it,
+each polyline is written to the file at once and nothing is kept in memory, so the memory used does not depend on
+the number of segments and the output does not depend on a resolution.
+
+>>> import io
+>>> output = io.StringIO()
+>>> with SvgImage(output, (10, 10)) as image:
+...     image.line([0, 0, 5, 5, 10, 0], fill=(255, 0, 0), width=2)
+>>> print(output.getvalue().splitlines()[-3])
+<path d="M0 0L5 5L10 0" stroke="#ff0000" stroke-width="2"/>
+"""
+
+import os
+
+import numpy as np
+from PIL import ImageColor
+
+from backends import Backend
+
+
+def open_vector(fp, size, format=None, mode='RGB', background=None):
+    """Open a vector image, SVG or PDF according to format or to the extension of fp
+
+    :param fp: File name or file object
+    :param size: Size of the image, in pixels
+    :param format: "SVG" or "PDF", guessed from the extension of fp if None
+    :param mode: Mode of the pillow image it replaces, used to read the colors
+    :param background: Background color, transparent if None
+    :type fp: str
+    :type size: tuple
+    :type format: str
+    :type mode: str
+    :type background: tuple
+
+    :return: The vector image
+    :rtype: VectorImage"""
+    if format is None:
+        format = os.path.splitext(getattr(fp, "name", fp))[1][1:]
+    formats = {"SVG": SvgImage, "PDF": PdfImage}
+    if format.upper() not in formats:
+        raise ValueError("unknown vector format: {}".format(format))
+    return formats[format.upper()](fp, size, mode, background)
+
+
+class VectorImage(Backend):
+    """Backend streaming the image to a file
+
+    :param fp: File name or file object, a file object is not closed
+    :param size: Size of the image, in pixels
+    :param mode: Mode of the pillow image it replaces, used to read the colors
+    :param background: Background color, transparent if None
+    :type fp: str
+    :type size: tuple
+    :type mode: str
+    :type background: tuple"""
+    binary = False
+    stage = "encode"
+
+    def __init__(self, fp, size, mode='RGB', background=None):
+        super().__init__(size, mode)
+        if isinstance(fp, (str, bytes, os.PathLike)):
+            self._file = open(fp, "wb" if self.binary else "w")
+            self._owned = True
+        else:
+            self._file = fp
+            self._owned = False
+        self.closed = False
+        self._begin(background)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _rgb(self, color):
+        """Red, green and blue of a color of the mode of the image
+
+        >>> image = SvgImage(open(os.devnull, "w"), (1, 1), mode='L')
+        >>> image._rgb(128), image._rgb("red"), image._rgb(None)
+        ((128, 128, 128), (255, 0, 0), (255, 255, 255))
+
+        :param color: Color as given to ImageDraw, white if None
+        :type color: tuple
+
+        :return: Red, green and blue between 0 and 255
+        :rtype: tuple"""
+        if color is None:
+            return 255, 255, 255
+        if isinstance(color, str):
+            return ImageColor.getrgb(color)[:3]
+        if isinstance(color, (int, float)):
+            if self.mode == '1':
+                color = 255 if color else 0
+            return int(color), int(color), int(color)
+        return tuple(int(value) for value in color[:3])
+
+    def polyline(self, points, fill=None, width=None):
+        """Write a polyline, a width of 0 or None draws lines of one pixel like a width of 1"""
+        self._line(points, self._rgb(fill), max(width or 0, 1))
+
+    def segments(self, segments, fill=None, width=None):
+        for points in self._runs(segments):
+            self.polyline(points, fill, width)
+
+    def point(self, xy, fill=None):
+        """Write points as squares of one pixel
+
+        Parameters are the same than ImageDraw.point"""
+        for x, y in np.asarray(xy, dtype=float).reshape(-1, 2).tolist():
+            self._square(x, y, self._rgb(fill))
+
+    def save(self, fp=None, format=None, **params):
+        """Close the image, it is already written to its file"""
+        self.close()
+
+    def close(self):
+        """End the file, the image can not be drawn on anymore"""
+        if self.closed:
+            return
+        self._end()
+        self.closed = True
+        if self._owned:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    @staticmethod
+    def _number(value):
+        """Shortest text of a coordinate, to the hundredth of a pixel
+
+        >>> VectorImage._number(2.0), VectorImage._number(1 / 3)
+        ('2', '0.33')"""
+        return ("%.2f" % value).rstrip("0").rstrip(".")
+
+    def _begin(self, background):
+        raise NotImplementedError
+
+    def _line(self, points, color, width):
+        raise NotImplementedError
+
+    def _square(self, x, y, color):
+        raise NotImplementedError
+
+    def _end(self):
+        raise NotImplementedError
+
+
+class SvgImage(VectorImage):
+    """Vector image streamed to an SVG file, each polyline is a path element"""
+
+    def _begin(self, background):
+        width, height = self.size
+        self._file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                         '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" viewBox="0 0 {0} {1}">\n'
+                         .format(width, height))
+        if background is not None:
+            self._file.write('<rect width="100%" height="100%" fill="{}"/>\n'.format(self._hex(background)))
+        self._file.write('<g fill="none" stroke-linecap="round" stroke-linejoin="round">\n')
+
+    def _hex(self, color):
+        return "#%02x%02x%02x" % self._rgb(color)
+
+    def _line(self, points, color, width):
+        number = self._number
+        path = "L".join(number(x) + " " + number(y) for x, y in points.tolist())
+        self._file.write('<path d="M{}" stroke="{}" stroke-width="{}"/>\n'.format(path, self._hex(color),
+                                                                                 number(width)))
+
+    def _square(self, x, y, color):
+        self._file.write('<rect x="{}" y="{}" width="1" height="1" fill="{}"/>\n'.format(
+            self._number(x), self._number(y), self._hex(color)))
+
+    def _end(self):
+        self._file.write('</g>\n</svg>\n')
+
+
+class PdfImage(VectorImage):
+    """Vector image streamed to a one page PDF file, a pixel is a point
+
+    The content stream is written as lines are drawn, its length and the cross-reference table are written on
+    close."""
+    binary = True
+
+    def _write(self, text):
+        data = text.encode("latin-1")
+        self._file.write(data)
+        self._position += len(data)
+
+    def _object(self, number, content):
+        self._offsets[number] = self._position
+        self._write("{} 0 obj\n{}\nendobj\n".format(number, content))
+
+    def _begin(self, background):
+        width, height = self.size
+        self._position = 0
+        self._offsets = {}
+        self._stroke = None
+        self._write("%PDF-1.4\n")
+        self._object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(2, "<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        self._object(3, "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {} {}] /Contents 4 0 R >>".format(width, height))
+        self._offsets[4] = self._position
+        self._write("4 0 obj\n<< /Length 5 0 R >>\nstream\n")
+        self._stream = self._position
+        self._write("1 0 0 -1 0 {} cm 1 J 1 j\n".format(height))
+        if background is not None:
+            self._write("{} rg 0 0 {} {} re f\n".format(self._color(background), width, height))
+
+    def _color(self, color):
+        return " ".join(self._number(value / 255) for value in self._rgb(color))
+
+    def _line(self, points, color, width):
+        number = self._number
+        if self._stroke != (color, width):
+            self._stroke = (color, width)
+            self._write("{} RG {} w\n".format(self._color(color), number(width)))
+        (x, y), others = points[0], points[1:].tolist()
+        self._write(number(x) + " " + number(y) + " m\n" +
+                    "".join(number(x) + " " + number(y) + " l\n" for x, y in others) + "S\n")
+
+    def _square(self, x, y, color):
+        self._write("{} rg {} {} 1 1 re f\n".format(self._color(color), self._number(x), self._number(y)))
+
+    def _end(self):
+        length = self._position - self._stream
+        self._write("endstream\nendobj\n")
+        self._object(5, str(length))
+        start = self._position
+        self._write("xref\n0 6\n0000000000 65535 f \n" +
+                    "".join("%010d 00000 n \n" % self._offsets[number] for number in range(1, 6)) +
+                    "trailer\n<< /Size 6 /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(start))